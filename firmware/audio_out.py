@@ -0,0 +1,63 @@
+from machine import PWM, Pin, Timer
+from array import array
+import micropython
+
+micropython.alloc_emergency_exception_buf(100)
+
+class AudioOutput:
+    def __init__(self, pwm_pin=15, sample_rate=20000, buffer_size=1024):
+        if buffer_size & (buffer_size - 1):
+            raise ValueError("Buffer size must be a power of two")
+        self.sample_rate = sample_rate
+        self.pwm = PWM(Pin(pwm_pin))
+        self.pwm.freq(sample_rate)
+        self.pwm.duty_u16(0)
+        self.timer = Timer(-1)
+
+        # RING BUFFER : WRITTEN BY THE SYNTH THREAD, DRAINED BY THE TIMER IRQ
+        self.buffer = array('H', [0] * buffer_size)
+        self.mask = buffer_size - 1
+        self.head = 0
+        self.tail = 0
+        self.last = 0
+        self.running = False
+        self.underruns = 0
+        self._drain_cb = self._drain
+
+    def _drain(self, _):
+        tail = self.tail
+        if tail == self.head:
+            # RENDERING FELL BEHIND : HOLD THE LAST LEVEL TO AVOID A CLICK
+            self.underruns += 1
+            return
+        self.last = self.buffer[tail]
+        self.pwm.duty_u16(self.last)
+        self.tail = (tail + 1) & self.mask
+
+    def available(self):
+        return (self.head - self.tail) & self.mask
+
+    def free(self):
+        return (self.tail - self.head - 1) & self.mask
+
+    def write(self, samples, n):
+        buf = self.buffer
+        mask = self.mask
+        head = self.head
+        for i in range(n):
+            buf[head] = samples[i]
+            head = (head + 1) & mask
+        self.head = head
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.timer.init(mode=Timer.PERIODIC, freq=self.sample_rate, callback=self._drain_cb, hard=True)
+
+    def stop(self):
+        if self.running:
+            self.timer.deinit()
+            self.running = False
+        self.head = 0
+        self.tail = 0
+        self.pwm.duty_u16(0)
@@ -0,0 +1,249 @@
+import uasyncio as asyncio
+from micropython import const
+import time
+from midi import MIDI_CLOCK, MIDI_START, MIDI_CONTINUE, MIDI_STOP
+
+# LAST STRETCH BEFORE A DEADLINE IS SPUN ON ticks_us INSTEAD OF SLEEPING THROUGH THE SCHEDULER
+SPIN_US = const(3000)
+
+class StepClock:
+    def __init__(self, bpm=80, steps_per_beat=4):
+        self.steps_per_beat = steps_per_beat
+        self.step = 0
+        self.start_us = 0
+        self.next_us = 0
+        self.remainder = 0
+        self.set_bpm(bpm)
+        self.reset_jitter()
+
+    def set_bpm(self, bpm):
+        # EXACT INTERVAL AS WHOLE MICROSECONDS + A CARRIED REMAINDER, SO ROUNDING NEVER DRIFTS
+        self.bpm = bpm
+        self.divisor = bpm * self.steps_per_beat
+        self.interval_us = 60_000_000 // self.divisor
+        self.interval_rem = 60_000_000 % self.divisor
+
+    def reset_jitter(self):
+        self.jitter_us = 0
+        self.max_jitter_us = 0
+        self.avg_jitter_us = 0
+
+    def start(self, start_us=None):
+        self.start_us = time.ticks_us() if start_us is None else start_us
+        self.next_us = self.start_us
+        self.remainder = 0
+        self.step = 0
+        self.reset_jitter()
+
+    def _advance(self):
+        self.remainder += self.interval_rem
+        delta = self.interval_us
+        if self.remainder >= self.divisor:
+            self.remainder -= self.divisor
+            delta += 1
+        self.next_us = time.ticks_add(self.next_us, delta)
+
+    def remaining_us(self):
+        return time.ticks_diff(self.next_us, time.ticks_us())
+
+    def deadline_us(self):
+        # ABSOLUTE TIME OF THE NEXT STEP : EVENTS CAN BE SCHEDULED AGAINST IT A STEP AHEAD
+        return self.next_us
+
+    def due(self):
+        return time.ticks_diff(time.ticks_us(), self.next_us) >= 0
+
+    def tick(self):
+        # CALLED AS THE STEP FIRES : MEASURE LATENESS, THEN MOVE TO THE NEXT ABSOLUTE DEADLINE
+        now = time.ticks_us()
+        late = time.ticks_diff(now, self.next_us)
+        self.jitter_us = late
+        if late > self.max_jitter_us:
+            self.max_jitter_us = late
+        self.avg_jitter_us = (self.avg_jitter_us * 7 + late) >> 3
+        self.step += 1
+        self._advance()
+
+        # MORE THAN A WHOLE STEP LATE : SKIP MISSED STEPS, STAY ON THE ORIGINAL GRID
+        while time.ticks_diff(now, self.next_us) >= self.interval_us:
+            self.step += 1
+            self._advance()
+        return late
+
+    async def wait(self):
+        # SLEEP THE COARSE PART THROUGH THE SCHEDULER, SPIN THE LAST FEW MILLISECONDS
+        remaining = self.remaining_us()
+        while remaining > SPIN_US:
+            await asyncio.sleep_ms((remaining - SPIN_US) // 1000)
+            remaining = self.remaining_us()
+        while time.ticks_diff(time.ticks_us(), self.next_us) < 0:
+            pass
+
+    def jitter(self):
+        return self.jitter_us, self.avg_jitter_us, self.max_jitter_us
+
+# EXTERNAL CLOCK : FOLLOWS MIDI CLOCK OR SYNC PULSES THROUGH A SECOND-ORDER PLL
+PERIOD_SHIFT = const(4)  # TICK PERIOD KEPT IN 1/16 US
+PERIOD_MASK = const(15)
+PHASE_SHIFT = const(1)  # PHASE CORRECTION : HALF THE ERROR PER TICK
+STALL_TICKS = const(4)  # A GAP THIS MANY PERIODS LONG RE-ANCHORS THE PHASE
+IDLE_US = const(100_000)  # REPORTED WHILE NO STEP IS SCHEDULED (STOPPED / NOT YET LOCKED)
+
+class ExternalClock:
+    # SAME SURFACE AS StepClock : start / remaining_us / due / tick / wait / jitter
+    def __init__(self, source, ticks_per_step=6, steps_per_beat=4, freq_shift=3, auto_start=False):
+        self.source = source
+        source.clock = self
+        self.ticks_per_step = ticks_per_step
+        self.steps_per_beat = steps_per_beat
+        self.freq_shift = freq_shift
+        self.auto_start = auto_start
+        self.phase_us = 0
+        self.phase_frac = 0
+        self.last_us = 0
+        self.reset()
+
+    def reset(self):
+        # FORGET THE LAST MASTER : RELOCK FROM SCRATCH, STOPPED UNTIL START (OR THE FIRST PULSE)
+        self.playing = False
+        self.synced = False
+        self.period16 = 0
+        self.interval_us = 0
+        self.outliers = 0
+        self.tick_index = -1
+        self.step = 0
+        self.reset_jitter()
+
+    def reset_jitter(self):
+        self.jitter_us = 0
+        self.max_jitter_us = 0
+        self.avg_jitter_us = 0
+
+    def bpm(self):
+        if not self.period16:
+            return 0
+        return (60_000_000 << PERIOD_SHIFT) // (self.period16 * self.ticks_per_step * self.steps_per_beat)
+
+    def _restart(self):
+        self.playing = True
+        self.tick_index = -1
+        self.step = 0
+
+    def song_position(self, sixteenths):
+        # SPP COUNTS MIDI BEATS OF 6 CLOCKS : THE NEXT 0xF8 IS THAT CLOCK, CONTINUE PLAYS FROM THERE
+        clocks = sixteenths * 6
+        self.tick_index = clocks - 1
+        self.step = (clocks + self.ticks_per_step - 1) // self.ticks_per_step
+
+    def feed(self, status, t_us):
+        if status == MIDI_CLOCK:
+            if self.auto_start and not self.playing:
+                self._restart()
+            self._track(t_us)
+            if self.playing:
+                self.tick_index += 1
+        elif status == MIDI_START:
+            self._restart()
+        elif status == MIDI_CONTINUE:
+            self.playing = True
+        elif status == MIDI_STOP:
+            self.playing = False
+
+    def _track(self, t_us):
+        # EVERY TICK TRAINS THE PLL, ALSO WHILE STOPPED : MASTERS KEEP SENDING 0xF8
+        raw = time.ticks_diff(t_us, self.last_us)
+        self.last_us = t_us
+        period = self.period16 >> PERIOD_SHIFT
+        if not self.synced or (period and raw > period * STALL_TICKS):
+            self.synced = True
+            self.phase_us = t_us
+            self.phase_frac = 0
+            return
+        if not period:
+            self._set_period(raw << PERIOD_SHIFT)
+            self.phase_us = t_us
+            return
+
+        step16 = self.period16 + self.phase_frac
+        expected = time.ticks_add(self.phase_us, step16 >> PERIOD_SHIFT)
+        self.phase_frac = step16 & PERIOD_MASK
+        error = time.ticks_diff(t_us, expected)
+        limit = period >> 1
+        if error > limit or error < -limit:
+            # ONE WILD INTERVAL IS A GLITCH, TWO IN A ROW ARE A TEMPO JUMP : RESEED FROM THE RAW INTERVAL
+            self.outliers += 1
+            if self.outliers >= 2:
+                self.outliers = 0
+                self._set_period(raw << PERIOD_SHIFT)
+            self.phase_us = t_us
+            self.phase_frac = 0
+            return
+
+        self.outliers = 0
+        self._set_period(self.period16 + ((error << PERIOD_SHIFT) >> self.freq_shift))
+        self.phase_us = time.ticks_add(expected, error >> PHASE_SHIFT)
+
+    def _set_period(self, period16):
+        self.period16 = period16
+        self.interval_us = (period16 * self.ticks_per_step) >> PERIOD_SHIFT
+
+    def _deadline(self):
+        # PREDICTED TIME OF THE TICK THAT OPENS THE NEXT STEP, FROM THE FILTERED PHASE
+        ahead = self.step * self.ticks_per_step - self.tick_index
+        if ahead <= 0:
+            return self.phase_us
+        if not self.period16:
+            return None
+        return time.ticks_add(self.phase_us, (ahead * self.period16) >> PERIOD_SHIFT)
+
+    def start(self, start_us=None):
+        self.source.poll()
+        self.reset_jitter()
+
+    def remaining_us(self):
+        self.source.poll()
+        if not self.playing:
+            return IDLE_US
+        now = time.ticks_us()
+        period = self.period16 >> PERIOD_SHIFT
+        if self.auto_start and period and time.ticks_diff(now, self.last_us) > period * STALL_TICKS:
+            # PULSES STOPPED : THE NEXT ONE RESTARTS THE PATTERN
+            self.playing = False
+            return IDLE_US
+        deadline = self._deadline()
+        if deadline is None:
+            return IDLE_US
+        return time.ticks_diff(deadline, now)
+
+    def deadline_us(self):
+        # PREDICTED FROM THE PLL, None UNTIL THE MASTER IS RUNNING AND ITS TEMPO IS KNOWN
+        return self._deadline() if self.playing else None
+
+    def due(self):
+        return self.remaining_us() <= 0
+
+    def tick(self):
+        deadline = self._deadline()
+        late = 0 if deadline is None else time.ticks_diff(time.ticks_us(), deadline)
+        self.jitter_us = late
+        if late > self.max_jitter_us:
+            self.max_jitter_us = late
+        self.avg_jitter_us = (self.avg_jitter_us * 7 + late) >> 3
+        self.step += 1
+
+        # THE TICK AFTER THIS STEP ALREADY ARRIVED : SKIP MISSED STEPS, STAY ON THE MASTER'S GRID
+        while (self.step + 1) * self.ticks_per_step <= self.tick_index:
+            self.step += 1
+        return late
+
+    async def wait(self):
+        # RETURNS ON THE DEADLINE, OR EARLY WHEN IT MOVES AWAY (MASTER STOPPED / SLOWED) : CHECK due()
+        remaining = self.remaining_us()
+        if remaining > SPIN_US:
+            await asyncio.sleep_ms((remaining - SPIN_US) // 1000)
+            remaining = self.remaining_us()
+        while 0 < remaining <= SPIN_US:
+            remaining = self.remaining_us()
+
+    def jitter(self):
+        return self.jitter_us, self.avg_jitter_us, self.max_jitter_us
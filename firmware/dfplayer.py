@@ -1,5 +1,34 @@
 import uasyncio as asyncio
 from machine import UART, Pin
+from micropython import const
+import time
+
+CMD_PLAY_FOLDER = const(0x0F)
+CMD_VOLUME = const(0x06)
+CMD_STOP = const(0x16)
+CMD_PAUSE = const(0x0E)
+CMD_RESUME = const(0x0D)
+CMD_QUERY_STATUS = const(0x42)
+CMD_QUERY_VOLUME = const(0x43)
+CMD_QUERY_TRACK = const(0x4C)
+
+# UNSOLICITED / REPLY FRAMES FROM THE MODULE
+REPLY_CARD_INSERTED = const(0x3A)
+REPLY_CARD_REMOVED = const(0x3B)
+REPLY_TRACK_FINISHED = const(0x3D)
+REPLY_INIT = const(0x3F)
+REPLY_ERROR = const(0x40)
+REPLY_ACK = const(0x41)
+
+# STATUS REPLY (0x42) LOW BYTE
+STATUS_PLAYING = const(1)
+
+# COMMANDS WHERE ONLY THE NEWEST UNSENT REQUEST MATTERS
+COALESCE = (CMD_PLAY_FOLDER, CMD_VOLUME)
+
+TX_SLOTS = const(8)
+RX_POLL_MS = const(5)
+QUERY_TIMEOUT_MS = const(200)
 
 class DFPlayer:
     START_BYTE = 0x7E
@@ -7,46 +36,228 @@ class DFPlayer:
     COMMAND_LENGTH = 0x06
     END_BYTE = 0xEF
 
-    def __init__(self, uart_id=0, tx_pin_id=0, rx_pin_id=1, volume=80):
+    def __init__(self, uart_id=0, tx_pin_id=0, rx_pin_id=1, volume=80, min_gap_ms=50):
         self.uart = UART(uart_id, baudrate=9600, tx=Pin(tx_pin_id), rx=Pin(rx_pin_id))
         self.volume_level = volume
+        self.min_gap_ms = min_gap_ms
+
+        # TX QUEUE : PREALLOCATED FRAMES, FILLED IN PLACE AND DRAINED BY A BACKGROUND TASK
+        self.frames = [bytearray(10) for _ in range(TX_SLOTS)]
+        for frame in self.frames:
+            frame[0] = self.START_BYTE
+            frame[1] = self.VERSION
+            frame[2] = self.COMMAND_LENGTH
+            frame[9] = self.END_BYTE
+        self.head = 0
+        self.tail = 0
+        self.last_tx = time.ticks_add(time.ticks_ms(), -min_gap_ms)
+        self.ready = asyncio.Event()
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+        # RX : PREALLOCATED READ + FRAME BUFFERS, STATE CACHED FROM EVERY REPLY
+        self.rx_buf = bytearray(32)
+        self.rx_frame = bytearray(10)
+        self.rx_pos = 0
+        self.rx_frames = 0
+        self.rx_errors = 0
+        self.playing = False
+        self.track = 0
+        self.finished_track = 0
+        self.error = 0
+        self.card_present = False
+        self.reply_cmd = 0
+        self.reply_value = 0
+        self.pending_cmd = 0
+        self.reply = asyncio.Event()
+        self.query_lock = asyncio.Lock()
+
+        asyncio.create_task(self._tx_task())
+        asyncio.create_task(self._rx_task())
         asyncio.create_task(self.volume(self.volume_level))
 
+    def _fill(self, frame, command, param1, param2):
+        frame[3] = command
+        frame[4] = 0x00
+        frame[5] = param1
+        frame[6] = param2
+        checksum = -(self.VERSION + self.COMMAND_LENGTH + command + param1 + param2) & 0xFFFF
+        frame[7] = (checksum >> 8) & 0xFF
+        frame[8] = checksum & 0xFF
+
+    def queue_cmd(self, command, param1=0, param2=0):
+        # NEVER BLOCKS : A NEWER PLAY / VOLUME REWRITES ITS PREDECESSOR IN PLACE WHEN THAT IS THE NEWEST
+        # UNSENT FRAME (NEVER ACROSS ANOTHER COMMAND : [PLAY, STOP] + PLAY MUST NOT BECOME [PLAY, STOP])
+        if command in COALESCE and self.head != self.tail:
+            frame = self.frames[(self.head - 1) % TX_SLOTS]
+            if frame[3] == command:
+                self._fill(frame, command, param1, param2)
+                self.coalesced += 1
+                return True
+
+        nxt = (self.head + 1) % TX_SLOTS
+        if nxt == self.tail:
+            self.dropped += 1
+            return False
+        self._fill(self.frames[self.head], command, param1, param2)
+        self.head = nxt
+        self.ready.set()
+        return True
+
+    async def _tx_task(self):
+        while True:
+            if self.head == self.tail:
+                self.ready.clear()
+                await self.ready.wait()
+                continue
+
+            # RATE LIMIT : KEEP THE MODULE'S MINIMUM GAP BETWEEN FRAMES
+            wait = time.ticks_diff(time.ticks_add(self.last_tx, self.min_gap_ms), time.ticks_ms())
+            if wait > 0:
+                await asyncio.sleep_ms(wait)
+                continue
+
+            self.uart.write(self.frames[self.tail])
+            self.last_tx = time.ticks_ms()
+            self.tail = (self.tail + 1) % TX_SLOTS
+            self.sent += 1
+
     async def send_cmd(self, command, param1=0, param2=0):
-        buffer = bytearray(10)
-        buffer[0] = self.START_BYTE
-        buffer[1] = self.VERSION
-        buffer[2] = self.COMMAND_LENGTH
-        buffer[3] = command
-        buffer[4] = 0x00
-        buffer[5] = param1
-        buffer[6] = param2
-        checksum = -(self.VERSION + self.COMMAND_LENGTH + command + buffer[4] + param1 + param2) & 0xFFFF
-        buffer[7] = (checksum >> 8) & 0xFF
-        buffer[8] = checksum & 0xFF
-        buffer[9] = self.END_BYTE
-        self.uart.write(buffer)
-        await asyncio.sleep_ms(50)
+        self.queue_cmd(command, param1, param2)
 
     async def play(self, folder, file):
         folder = int(folder)
         file = int(file)
-        await self.send_cmd(0x0F, folder, file)
+        self.queue_cmd(CMD_PLAY_FOLDER, folder, file)
+        self.playing = True
+        self.track = file
+        self.error = 0
 
     async def volume(self, volume):
         self.volume_level = max(0, min(volume, 30))
-        await self.send_cmd(0x06, 0x00, self.volume_level)
+        self.queue_cmd(CMD_VOLUME, 0x00, self.volume_level)
 
     async def stop(self):
-        await self.send_cmd(0x16)
+        self.queue_cmd(CMD_STOP)
+        self.playing = False
 
     async def pause(self):
-        await self.send_cmd(0x0E)
+        self.queue_cmd(CMD_PAUSE)
 
     async def resume(self):
-        await self.send_cmd(0x0D)
+        self.queue_cmd(CMD_RESUME)
+
+# RX : FRAMING, CHECKSUM AND STATE TRACKING
+
+    async def _rx_task(self):
+        while True:
+            if self.uart.any():
+                n = self.uart.readinto(self.rx_buf)
+                if n:
+                    self.feed(self.rx_buf, n)
+            await asyncio.sleep_ms(RX_POLL_MS)
+
+    def feed(self, data, n):
+        for i in range(n):
+            self._push(data[i])
+
+    def _push(self, b):
+        frame = self.rx_frame
+        pos = self.rx_pos
+        if pos == 0:
+            if b == self.START_BYTE:
+                frame[0] = b
+                self.rx_pos = 1
+            return
+        frame[pos] = b
+        if (pos == 1 and b != self.VERSION) or (pos == 2 and b != self.COMMAND_LENGTH):
+            self._resync(pos)
+            return
+        if pos < 9:
+            self.rx_pos = pos + 1
+            return
+
+        # FULL FRAME : END BYTE + CHECKSUM
+        checksum = (frame[7] << 8) | frame[8]
+        if b == self.END_BYTE and (frame[1] + frame[2] + frame[3] + frame[4] + frame[5] + frame[6] + checksum) & 0xFFFF == 0:
+            self.rx_pos = 0
+            self.rx_frames += 1
+            self._handle(frame[3], (frame[5] << 8) | frame[6])
+        else:
+            self._resync(9)
+
+    def _resync(self, end):
+        # BAD FRAME : A TRUNCATED REPLY HIDES THE START OF THE NEXT ONE IN ITS OWN BYTES,
+        # SO THE BUFFER IS RE-SCANNED FROM THE NEXT START BYTE INSTEAD OF BEING THROWN AWAY
+        self.rx_errors += 1
+        frame = self.rx_frame
+        while True:
+            k = 1
+            while k <= end and frame[k] != self.START_BYTE:
+                k += 1
+            if k > end:
+                self.rx_pos = 0
+                return
+            for j in range(end - k + 1):
+                frame[j] = frame[k + j]
+            end -= k
+            if (end >= 1 and frame[1] != self.VERSION) or (end >= 2 and frame[2] != self.COMMAND_LENGTH):
+                continue
+            self.rx_pos = end + 1
+            return
+
+    def _handle(self, command, value):
+        if command == REPLY_TRACK_FINISHED:
+            self.playing = False
+            self.finished_track = value
+        elif command == REPLY_INIT:
+            self.card_present = bool(value & 0x02)
+        elif command == REPLY_CARD_INSERTED:
+            self.card_present = True
+        elif command == REPLY_CARD_REMOVED:
+            self.card_present = False
+            self.playing = False
+        elif command == REPLY_ERROR:
+            self.error = value & 0xFF
+        elif command == CMD_QUERY_STATUS:
+            self.playing = (value & 0xFF) == STATUS_PLAYING
+        elif command == CMD_QUERY_VOLUME:
+            self.volume_level = value & 0xFF
+        elif command == CMD_QUERY_TRACK:
+            self.track = value
+
+        # WAKE A PENDING QUERY ON ITS REPLY (OR ON AN ERROR, WHICH ANSWERS IT)
+        if self.pending_cmd and (command == self.pending_cmd or command == REPLY_ERROR):
+            self.reply_cmd = command
+            self.reply_value = value
+            self.reply.set()
+
+    async def query(self, command, timeout_ms=QUERY_TIMEOUT_MS):
+        # ROUND TRIP : RETURNS THE 16-BIT REPLY VALUE, OR None ON ERROR / TIMEOUT
+        async with self.query_lock:
+            self.pending_cmd = command
+            self.reply.clear()
+            self.queue_cmd(command)
+            try:
+                await asyncio.wait_for_ms(self.reply.wait(), timeout_ms + self.min_gap_ms)
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                self.pending_cmd = 0
+            return self.reply_value if self.reply_cmd == command else None
+
+    async def query_status(self, timeout_ms=QUERY_TIMEOUT_MS):
+        value = await self.query(CMD_QUERY_STATUS, timeout_ms)
+        return None if value is None else value & 0xFF
+
+    async def query_volume(self, timeout_ms=QUERY_TIMEOUT_MS):
+        value = await self.query(CMD_QUERY_VOLUME, timeout_ms)
+        return None if value is None else value & 0xFF
+
+    async def query_track(self, timeout_ms=QUERY_TIMEOUT_MS):
+        return await self.query(CMD_QUERY_TRACK, timeout_ms)
 
-    async def is_playing(self):
-        self.uart.write(b'\x7E\xFF\x06\x42\x00\x00\x00\xFE\xBA\xEF')
-        await asyncio.sleep_ms(10)
-        return self.uart.any()
+    def is_playing(self):
+        # CACHED : KEPT CURRENT BY THE RX TASK, NO ROUND TRIP
+        return self.playing
@@ -1,5 +1,24 @@
 import machine
 import time
+from micropython import const
+from array import array
+import uasyncio as asyncio
+from ringbuf import RingBuffer
+
+# QUADRATURE STATE TABLE : INDEX = (PREVIOUS AB << 2) | CURRENT AB, INVALID (SKIPPED) STATES COUNT 0
+# SIGN KEPT FROM THE ORIGINAL DECODER : CW = +1
+QDEC = array('b', [0, -1, 1, 0, 1, 0, 0, -1, -1, 0, 0, 1, 0, 1, -1, 0])
+STEPS_PER_DETENT = const(4)  # KY-040 : ONE FULL QUADRATURE CYCLE PER DETENT
+
+# BUTTON EVENTS
+BUTTON_CLICK = const(1)
+BUTTON_DOUBLE = const(2)  # SENT AFTER THE SECOND CLICK
+BUTTON_LONG = const(3)  # SENT WHILE STILL HELD, NO CLICK FOLLOWS ON RELEASE
+
+DEBOUNCE_MS = const(20)
+DOUBLE_MS = const(300)
+LONG_MS = const(600)
+BUTTON_POLL_MS = const(10)
 
 class Encoder:
     def __init__(self, clk_pin, dt_pin, sw_pin):
@@ -7,31 +26,118 @@ class Encoder:
         self.dt = machine.Pin(dt_pin, machine.Pin.IN, machine.Pin.PULL_UP)
         self.sw = machine.Pin(sw_pin, machine.Pin.IN, machine.Pin.PULL_UP)
 
+        # ROTATION : BOTH PINS, BOTH EDGES, DECODED IN THE IRQ INTO A QUARTER-STEP COUNTER
         self.last_state = (self.clk.value() << 1) | self.dt.value()
-        self.last_time = time.ticks_ms()
+        self.quarters = 0
+        self._edge_cb = self._edge
+        edges = machine.Pin.IRQ_RISING | machine.Pin.IRQ_FALLING
+        self.clk.irq(handler=self._edge_cb, trigger=edges, hard=True)
+        self.dt.irq(handler=self._edge_cb, trigger=edges, hard=True)
 
-    def get_direction(self):
+        # BUTTON : THE IRQ ONLY LOGS (LEVEL, TIME), DEBOUNCE AND GESTURES ARE WORKED OUT ON READ
+        self.edges = RingBuffer(32, 'i', 2)
+        self.edge = array('i', [0, 0])
+        self.events = RingBuffer(8)
+        self.raw = self.sw.value()
+        self.raw_ms = time.ticks_ms()
+        self.pressed = False
+        self.press_ms = 0
+        self.click_ms = 0
+        self.long_sent = False
+        self._button_cb = self._button_edge
+        self.sw.irq(handler=self._button_cb, trigger=edges, hard=True)
+
+    def _edge(self, _):
         state = (self.clk.value() << 1) | self.dt.value()
-        now = time.ticks_ms()
+        self.quarters += QDEC[(self.last_state << 2) | state]
+        self.last_state = state
+
+    def _button_edge(self, pin):
+        self.edges.put(pin.value(), time.ticks_ms())
 
-        if state != self.last_state and time.ticks_diff(now, self.last_time) > 5:
-            self.last_time = now
-            transition = (self.last_state << 2) | state
-            self.last_state = state
+    def get_steps(self):
+        # WHOLE DETENTS TURNED SINCE THE LAST CALL (SIGNED), PARTIAL ONES STAY IN THE COUNTER
+        state = machine.disable_irq()
+        quarters = self.quarters
+        steps = quarters // STEPS_PER_DETENT if quarters >= 0 else -(-quarters // STEPS_PER_DETENT)
+        self.quarters = quarters - steps * STEPS_PER_DETENT
+        machine.enable_irq(state)
+        return steps
 
-            # Reversed directions to match intended CW = increase
-            if transition in (0b0001, 0b0111, 0b1110, 0b1000):
-                return -1  # Originally CW, now interpreted as decrease
-            elif transition in (0b0010, 0b0100, 0b1101, 0b1011):
-                return 1   # Originally CCW, now interpreted as increase
+    def get_direction(self):
+        # ONE DETENT PER CALL : A FAST TURN IS DELIVERED OVER THE NEXT FEW CALLS, NEVER DROPPED
+        state = machine.disable_irq()
+        quarters = self.quarters
+        if quarters >= STEPS_PER_DETENT:
+            self.quarters = quarters - STEPS_PER_DETENT
+            direction = 1
+        elif quarters <= -STEPS_PER_DETENT:
+            self.quarters = quarters + STEPS_PER_DETENT
+            direction = -1
+        else:
+            direction = 0
+        machine.enable_irq(state)
+        return direction
+
+# BUTTON
 
-        return 0
+    def _accept(self, level, at_ms):
+        # A DEBOUNCED LEVEL CHANGE : PRESS STARTS TIMING, RELEASE BECOMES A CLICK (OR ENDS A LONG PRESS)
+        down = level == 0
+        if down == self.pressed:
+            return
+        self.pressed = down
+        if down:
+            self.press_ms = at_ms
+            self.long_sent = False
+            return
+        if self.long_sent:
+            return
+        if time.ticks_diff(at_ms, self.press_ms) >= LONG_MS:
+            self.events.put(BUTTON_LONG)
+            return
+        self.events.put(BUTTON_CLICK)
+        if self.click_ms and time.ticks_diff(at_ms, self.click_ms) <= DOUBLE_MS:
+            self.events.put(BUTTON_DOUBLE)
+            self.click_ms = 0
+        else:
+            self.click_ms = at_ms
+
+    def _update(self):
+        # REPLAY LOGGED EDGES : A LEVEL THAT HELD FOR DEBOUNCE_MS BEFORE THE NEXT EDGE WAS REAL
+        edge = self.edge
+        while self.edges.get_into(edge):
+            if time.ticks_diff(edge[1], self.raw_ms) >= DEBOUNCE_MS:
+                self._accept(self.raw, self.raw_ms)
+            self.raw = edge[0]
+            self.raw_ms = edge[1]
+
+        now = time.ticks_ms()
+        if time.ticks_diff(now, self.raw_ms) >= DEBOUNCE_MS:
+            self._accept(self.raw, self.raw_ms)
+        if self.pressed and not self.long_sent and time.ticks_diff(now, self.press_ms) >= LONG_MS:
+            self.long_sent = True
+            self.events.put(BUTTON_LONG)
+
+    def get_button_event(self):
+        # NEXT BUTTON_* EVENT OR 0, NEVER WAITS
+        self._update()
+        event = self.events.get()
+        return event if event > 0 else 0
 
     def get_button_press(self):
-        if self.sw.value() == 0:
-            time.sleep_ms(50)
-            if self.sw.value() == 0:
-                while self.sw.value() == 0:
-                    pass
+        # ANY COMPLETED PRESS (CLICK OR LONG), DOUBLE-CLICK MARKERS ARE SKIPPED
+        self._update()
+        while True:
+            event = self.events.get()
+            if event < 0:
+                return False
+            if event != BUTTON_DOUBLE:
                 return True
-        return False
+
+    async def wait_button(self):
+        while True:
+            event = self.get_button_event()
+            if event:
+                return event
+            await asyncio.sleep_ms(BUTTON_POLL_MS)
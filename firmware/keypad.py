@@ -1,6 +1,15 @@
-# UPDATED TO EXPOSE PRESSED KEY DIRECTLY
+# BACKGROUND MATRIX SCANNER : A TIMER IRQ DRIVES ONE COLUMN PER TICK AND READS THE ONE DRIVEN ON THE LAST TICK
+# FULL MATRIX STATE IS A BITMASK, PRESS / RELEASE EVENTS ARE QUEUED WITH A TIMESTAMP
 from machine import Pin, Timer
+from micropython import const
+from array import array
 import utime
+from ringbuf import RingBuffer
+
+SCAN_HZ = const(800)  # ONE COLUMN PER TICK : 4 COLUMNS = 5 MS PER FULL SCAN
+DEBOUNCE_MS = const(10)
+EVENT_SLOTS = const(32)
+RELEASED = const(0x100)  # EVENT CODE = KEY INDEX, | RELEASED ON KEY UP
 
 class Keypad:
     def __init__(self, keymap, row_pins, column_pins, num_rows, num_cols):
@@ -9,40 +18,85 @@ class Keypad:
         self._column_pins = [Pin(pin, Pin.OUT) for pin in column_pins]
         self._num_rows = num_rows
         self._num_cols = num_cols
-        self._prev_key = None
-        self._debounce_time = 400
-        self._prev_time = 0
+        self._bits = {key: 1 << index for index, key in enumerate(keymap)}
+
+        # SCANNER STATE : TOUCHED ONLY BY THE IRQ (events IS THE SPSC HAND-OFF)
+        self.state = 0  # DEBOUNCED, BIT n = keymap[n] HELD
+        self._counts = array('B', [0] * (num_rows * num_cols))
+        self._column = 0
+        self.events = RingBuffer(EVENT_SLOTS, 'i', 2)
+        self._event = array('i', [0, 0])
+        self.set_debounce_time(DEBOUNCE_MS)
 
         for col_pin in self._column_pins:
             col_pin.value(1)
+        self._column_pins[0].value(0)
+
+        self._scan_cb = self._scan
+        self._timer = Timer(-1)
+        self._timer.init(mode=Timer.PERIODIC, freq=SCAN_HZ, callback=self._scan_cb, hard=True)
+
+    def _scan(self, _):
+        # THE COLUMN DRIVEN LOW ON THE PREVIOUS TICK HAS SETTLED : READ ITS ROWS, THEN MOVE ON
+        col = self._column
+        cols = self._num_cols
+        rows = self._row_pins
+        counts = self._counts
+        state = self.state
+        for row in range(self._num_rows):
+            index = row * cols + col
+            bit = 1 << index
+            down = not rows[row].value()
+            if down == bool(state & bit):
+                counts[index] = 0
+                continue
+            # PER-KEY DEBOUNCE : THE NEW LEVEL MUST HOLD FOR debounce_scans FULL SCANS
+            count = counts[index] + 1
+            if count < self._debounce_scans:
+                counts[index] = count
+                continue
+            counts[index] = 0
+            state ^= bit
+            self.events.put(index if down else index | RELEASED, utime.ticks_ms())
+        self.state = state
+
+        self._column_pins[col].value(1)
+        col = col + 1 if col + 1 < cols else 0
+        self._column_pins[col].value(0)
+        self._column = col
+
+    def get_event(self):
+        # NEXT (key, pressed, ticks_ms) OR None
+        event = self._event
+        if not self.events.get_into(event):
+            return None
+        code = event[0]
+        return self._keymap[code & 0xFF], not code & RELEASED, event[1]
 
     def get_key(self):
-        for col_index, col_pin in enumerate(self._column_pins):
-            col_pin.value(0)
-            for row_index, row_pin in enumerate(self._row_pins):
-                if not row_pin.value():
-                    key = self._keymap[row_index * self._num_cols + col_index]  # ← define key FIRST
-                    current_time = utime.ticks_ms()
-                    if self._prev_key != key or (self._prev_key == key and utime.ticks_diff(current_time, self._prev_time) > self._debounce_time):
-                        self._prev_key = key
-                        self._prev_time = current_time
-                        col_pin.value(1)
-                        return key
-            col_pin.value(1)
+        # NEXT KEY PRESS, RELEASES ARE SKIPPED (HELD KEYS ARE CHECKED WITH is_pressed)
+        event = self._event
+        events = self.events
+        while events.get_into(event):
+            code = event[0]
+            if not code & RELEASED:
+                return self._keymap[code]
         return None
 
-
     def is_pressed(self, key_to_check):
-        for col_index, col_pin in enumerate(self._column_pins):
-            col_pin.value(0)
-            for row_index, row_pin in enumerate(self._row_pins):
-                if not row_pin.value():
-                    key = self._keymap[row_index * self._num_cols + col_index]
-                    if key == key_to_check:
-                        col_pin.value(1)
-                        return True
-            col_pin.value(1)
-        return False
+        return bool(self.state & self._bits.get(key_to_check, 0))
+
+    def pressed_keys(self):
+        return [key for key, bit in self._bits.items() if self.state & bit]
+
+    def clear(self):
+        self.events.clear()
 
     def set_debounce_time(self, time_ms):
         self._debounce_time = time_ms
+        self._debounce_scans = max(1, time_ms * SCAN_HZ // (self._num_cols * 1000))
+
+    def deinit(self):
+        self._timer.deinit()
+        for col_pin in self._column_pins:
+            col_pin.value(1)
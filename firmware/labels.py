@@ -0,0 +1,44 @@
+# GENERATED BY tools/gen_labels.py : DO NOT EDIT
+# MENU LABELS PRE-ENCODED TO TM1637 SEGMENTS, WRITTEN TO THE DISPLAY AS-IS
+
+BLANK = b'\x00\x00\x00\x00'
+
+LABELS = {
+    'P1': b'\x73\x06\x00\x00',  # P1
+    'P2': b'\x73\x5B\x00\x00',  # P2
+    'P3': b'\x73\x4F\x00\x00',  # P3
+    'P4': b'\x73\x66\x00\x00',  # P4
+    'SELECT': b'\x6D\x79\x38\x00',  # SEL
+    'SAMPLE': b'\x6D\x77\x55\x73',  # SAMP
+    'SYNTH': b'\x6D\x6E\x54\x78',  # SYNT
+    'SEQ': b'\x6D\x79\x67\x00',  # SEQ
+    'CONFIGURE': b'\x39\x54\x71\x3D',  # CNFG
+    'BACK': b'\x7C\x77\x39\x76',  # BACK
+    'BPM': b'\x7C\x73\x55\x00',  # BPM
+    'WAVE': b'\x2A\x77\x1C\x79',  # WAVE
+    'SIN': b'\x6D\x06\x54\x00',  # SIN
+    'TRI': b'\x78\x50\x06\x00',  # TRI
+    'SAW': b'\x6D\x77\x2A\x00',  # SAW
+    'SQR': b'\x6D\x67\x50\x00',  # SQR
+    'CTRL': b'\x39\x78\x50\x38',  # CTRL
+    'DISABLED': b'\x5E\x6D\x7C\x38',  # DSBL
+    'CUTOFF': b'\x39\x3E\x78\x00',  # CUT
+    'ASDR': b'\x71\x06\x54\x00',  # FIN
+    'ASDR_WAVE': b'\x77\x6D\x5E\x50',  # ASDR
+    'FILTER MOD': b'\x71\x55\x3F\x5E',  # FMOD
+    'FILTER SWEEP': b'\x71\x6D\x2A\x73',  # FSWP
+    'PITCH BEND': b'\x73\x7C\x54\x5E',  # PBND
+    'ON': b'\x3F\x54\x00\x00',  # ON
+    'OFF': b'\x3F\x71\x71\x00',  # OFF
+    'MIDI': b'\x55\x06\x5E\x06',  # MIDI
+    'MIDI ON': b'\x3F\x54\x00\x00',  # ON
+    'MIDI OFF': b'\x3F\x71\x71\x00',  # OFF
+    'SYNC': b'\x6D\x6E\x54\x39',  # SYNC
+    'SYNC ON': b'\x3F\x54\x00\x00',  # ON
+    'SYNC OFF': b'\x3F\x71\x71\x00',  # OFF
+    'PULSE': b'\x73\x73\x6D\x00',  # PPS
+    'CLOCK': b'\x39\x38\x76\x00',  # CLK
+    'CLOCK INT': b'\x06\x54\x78\x00',  # INT
+    'CLOCK MIDI': b'\x55\x06\x5E\x06',  # MIDI
+    'CLOCK SYNC': b'\x6D\x6E\x54\x39',  # SYNC
+}
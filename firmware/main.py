@@ -1,7 +1,6 @@
 # STANDARD LIBRARIES
 import uasyncio as asyncio
 import time
-import ujson
 from machine import Pin, UART
 
 # PERIPHERAL DRIVERS
@@ -10,17 +9,18 @@ from keypad import Keypad
 from navpad import Navpad
 from encoder import Encoder
 from tm1637 import TM1637
+from labels import LABELS, BLANK
 
 # CUSTOM OBJECTS
 from sequencer import Sequencer
 from tremolo import TremoloController
-from synthesizer import Synthesizer
+from synthesizer import Synthesizer, KEY_NOTES
 
 # DRIVER INITIALIZATION
 df = DFPlayer(uart_id=0, tx_pin_id=0, rx_pin_id=1)
 df.volume(100)
 
-midi_uart = UART(1, baudrate=31250, tx=Pin(20))
+midi_uart = UART(1, baudrate=31250, tx=Pin(20), rx=Pin(21))
 
 tm_display = TM1637(clk=Pin(5), dio=Pin(4))
 
@@ -34,7 +34,7 @@ A_KEYMAP = ['1', '2', '3', 'A',
           '13', '14', '15', 'D']
 
 keypad = Keypad(A_KEYMAP, A_ROW_PINS, A_COLUMN_PINS, A_ROWS, A_COLS)
-keypad.set_debounce_time(200)
+keypad.set_debounce_time(10)
 
 B_PINS = [19, 18, 17, 16]
 B_KEYMAP = ['17', '18', '19', 'E']
@@ -52,41 +52,19 @@ current_program_index = 0
 
 tm_display.scroll("Hello Hello Hello Hello")
 
-# HANDLE PROGRAM DATA [JSON]
-from program_io import load_program, save_program
-
-def load_program(program_name):  # Legacy definition replaced
-    folder_number = int(program_name[1:])
-    try:
-        with open(f"{program_name}.json", "r") as f:
-            data = ujson.load(f)
-    except:
-        data = {}
-    return {
-        "program": program_name,
-        "folder": folder_number,
-        "bank":data.get("bank",1),
-        "bpm": data.get("bpm", 80),
-        "waveform": data.get("waveform", "SIN"),
-        "control": data.get("control", "DISABLED"),
-        "control_value": data.get("control_value", 0),
-        "sequence": data.get("sequence", [None] * 16),
-        "midi": data.get("midi", False),
-        "sync": data.get("sync", False)
-    }
+# HANDLE PROGRAM DATA [BINARY RECORD, JSON IMPORT]
+from program_io import load_program, save_program, flush_programs
 
-def save_program(program_data):
-    name = program_data.get("program")
-    if not name:
-        folder = program_data.get("folder", 1)
-        name = f"P{folder}"
-        program_data["program"] = name
-    with open(f"{name}.json", "w") as f:
-        ujson.dump(program_data, f)
-        
-def display_program(name):
-    tm_display.show('    ')
-    tm_display.show(name)
+# RESIDENT PROGRAMS : ALL FOUR LOADED ONCE AT BOOT, EDITED IN PLACE, WRITTEN BEHIND
+program_cache = {name: load_program(name) for name in programs}
+
+# ONE AUDIO ENGINE AND ONE SEQUENCER FOR THE WHOLE SESSION : RE-POINTED, NEVER REBUILT
+synth = Synthesizer(pwm_pin=15)
+sequencer = Sequencer(encoder, tm_display, df, keypad, navpad, midi_uart, synth=synth)
+
+def display_program(name, preempt=True):
+    # PROGRAM SELECTION IS A DIRECT ACTION : IT CUTS SHORT THE BOOT SCROLL
+    tm_display.write(LABELS.get(name, BLANK), preempt=preempt)
 
 def change_bank(program_data, toggle):
     bank = program_data.get("bank", 1)
@@ -100,73 +78,8 @@ def change_bank(program_data, toggle):
 # DISPLAY MAP
 
 def display_mode(mode):
-    tm_display.show('    ')
-    
-    # PROGRAM SUB-MENU
-    if mode == "SELECT":
-        tm_display.show("SEL")
-    elif mode == "SAMPLE":
-        tm_display.show("SAMP")
-    elif mode == "SYNTH":
-        tm_display.show("SYNT")
-    elif mode == "SEQ":
-        tm_display.show("SEQ")
-    elif mode == "CONFIGURE":
-    
-    # CONFIGURATION MENU
-        tm_display.show("CNFG")
-    elif mode == "BACK":
-        tm_display.show("BACK")
-    elif mode == "BPM":
-        tm_display.show("BPM")
-    elif mode == "WAVE":
-    
-    # WAVEFORMS
-        tm_display.show("WAVE")
-    elif mode == "SIN":
-        tm_display.show("SIN")
-    elif mode == "TRI":
-        tm_display.show("TRI")
-    elif mode == "SAW":
-        tm_display.show("SAW")
-    elif mode == "SQR":
-        tm_display.show("SQR")
-    
-    # CONTROL MODES
-    elif mode == "CTRL":
-        tm_display.show("CTRL")
-    elif mode == "DISABLED":
-        tm_display.show("DSBL")
-    elif mode == "CUTOFF":
-        tm_display.show("CUT")
-    elif mode == "ASDR":
-        tm_display.show("FIN")
-    elif mode == "ASDR_WAVE":
-        tm_display.show("ASDR")
-    elif mode == "FILTER MOD":
-        tm_display.show("FMOD")
-    elif mode == "FILTER SWEEP":
-        tm_display.show("FSWP")
-    elif mode == "PITCH BEND":
-        tm_display.show("PBND")
-    elif mode == "ON":
-        tm_display.show("ON")
-    elif mode == "OFF":
-        tm_display.show("OFF")
-        
-    # MIDI / SYNC
-    elif mode == "MIDI":
-        tm_display.show("MIDI")
-    elif mode == "MIDI ON":
-        tm_display.show("ON")
-    elif mode == "MIDI OFF":
-        tm_display.show("OFF")
-    elif mode == "SYNC":
-        tm_display.show("SYNC")
-    elif mode == "SYNC ON":
-        tm_display.show("ON")
-    elif mode == "SYNC OFF":
-        tm_display.show("OFF")
+    # PRE-ENCODED LABEL (labels.py, BUILT BY tools/gen_labels.py) : AN UNCHANGED LABEL IS NOT RE-SENT
+    tm_display.write(LABELS.get(mode, BLANK))
 
 running_program = False
 sequencer_global = None  # GLOBAL SEQUENCER REFERENCE
@@ -175,17 +88,19 @@ sequencer_global = None  # GLOBAL SEQUENCER REFERENCE
 
 async def synth_mode(program_data):
     display_mode("SYNTH")
-    synth = Synthesizer(pwm_pin=15, program_data=program_data)
+    synth.set_program(program_data)
 
-    note_map = {
-        '1': 261.63, '2': 293.66, '3': 329.63, 'A': 349.23,
-        '4': 392.00, '5': 440.00, '6': 493.88, 'B': 523.25,
-        '7': 554.37, '8': 587.33, '9': 622.25, 'C': 659.25,
-        '10': 698.46, '11': 739.99, '12': 783.99, 'D': 830.61
-    }
+    held_keys = []
+    key_notes = {}
+    send_midi = program_data.get("midi", False)
+    midi_out = sequencer.midi_out
+    midi_out.channel = program_data.get("midi_channel", 1) - 1
 
-    current_key = None
+    # EXTERNAL KEYBOARD : PARSED NOTES GO STRAIGHT TO THE SYNTH (THE SEQUENCER'S PARSER, SHARED)
+    midi_in = sequencer.midi_in
+    midi_in.enable()
     while True:
+        midi_in.poll()
         key = keypad.get_key()
         nav = navpad.get_key()
 
@@ -197,23 +112,36 @@ async def synth_mode(program_data):
             # elif nav == '18':
             # elif nav == '17':
 
-        if key in note_map:
-            if key != current_key:
-                    synth.stop_note()
-                    current_key = key
-                    synth.start_note(note_map[key])
-        else:
-            # NO KEY DETECTED, CHECKS FOR RELEASE OF MOST RECENT KEY
-            if current_key and not keypad.is_pressed(current_key):
-                synth.stop_note()
-                current_key = None
-       
+        # NEW KEY : ADD A VOICE, HELD KEYS KEEP SOUNDING (CHORDS)
+        if key in KEY_NOTES and key not in held_keys:
+            held_keys.append(key)
+            synth.note_on(KEY_NOTES[key], key)
+            if send_midi:
+                key_notes[key] = KEY_NOTES[key] + 12 * synth.octave_shift
+                midi_out.note_on(key_notes[key])
+
+        # RELEASE EVERY HELD KEY THAT IS NO LONGER PRESSED
+        for i in range(len(held_keys) - 1, -1, -1):
+            if not keypad.is_pressed(held_keys[i]):
+                released = held_keys.pop(i)
+                synth.note_off(released)
+                if released in key_notes:
+                    midi_out.note_off(key_notes.pop(released))
+
+        # ONE UART WRITE FOR EVERY NOTE ON / OFF FROM THIS SCAN
+        midi_out.flush()
+
         direction = encoder.get_direction()
         if direction:
             synth.update_control(direction)
 
         if encoder.get_button_press():
-            synth.stop_note()
+            synth.all_notes_off()
+            for note in key_notes.values():
+                midi_out.note_off(note)
+            midi_out.flush()
+            midi_in.disable()
+            # THE ENGINE AND ITS CORE-1 WORKER STAY UP FOR THE NEXT MODE : NOTES ARE RELEASED ONLY
             return
 
         await asyncio.sleep_ms(10)
@@ -253,10 +181,12 @@ async def sample_mode(folder, program_data):
         if nav:
             if nav == 'E':
                 change_bank(program_data, toggle=True)
+                tm_display.cancel()
                 tm_display.scroll(f"B{program_data['bank']}")
                 display_mode("SAMPLE")
             elif nav == '19':
                 change_bank(program_data, toggle=False)
+                tm_display.cancel()
                 tm_display.scroll(f"B{program_data['bank']}")
                 display_mode("SAMPLE")
                 
@@ -266,17 +196,18 @@ async def sample_mode(folder, program_data):
         if encoder.get_button_press():
             running_program = False
 
+        # YIELD : THE DFPLAYER TX QUEUE, DISPLAY ANIMATIONS AND WRITE-BEHIND RUN AS TASKS
+        await asyncio.sleep_ms(1)
+
 # PROGRAM SUB-MENU
 
 async def launch_program(program_index):
     global running_program, sequencer_global
     folder = program_index + 1
-    program_data = load_program(programs[program_index])
+    program_data = program_cache[programs[program_index]]
     program_data["folder"] = folder
     submenu_index = 0
     submenu_options = ["SELECT", "SAMPLE", "SYNTH", "SEQ", "CONFIGURE"]
-    last_time = time.ticks_ms()
-    last_dir = 0
 
     if "bpm" not in program_data:
         program_data["bpm"] = 80
@@ -286,51 +217,48 @@ async def launch_program(program_index):
     while True:
         display_mode(submenu_options[submenu_index])
         direction = encoder.get_direction()
-        now = time.ticks_ms()
 
         if direction != 0:
-            if direction != last_dir or time.ticks_diff(now, last_time) > 200:
-                submenu_index = (submenu_index + direction) % len(submenu_options)
-                display_mode(submenu_options[submenu_index])
-                last_dir = direction
-                last_time = now
+            submenu_index = (submenu_index + direction) % len(submenu_options)
+            display_mode(submenu_options[submenu_index])
 
         if encoder.get_button_press():
             mode = submenu_options[submenu_index]
 
             if mode == "SELECT":
+                flush_programs()
                 return
 
             elif mode == "SAMPLE":
                 await sample_mode(folder, program_data)
+                flush_programs()
 
             elif mode == "SYNTH":
                 await synth_mode(program_data)
+                flush_programs()
 
             elif mode == "SEQ":
                 display_mode("SEQ")
-                tm_display.show('    ')
-                sequencer = Sequencer(encoder, tm_display, df, keypad, navpad, midi_uart, program_data)
+                tm_display.write(BLANK)
+                sequencer.set_program(program_data)
                 sequencer.set_folder(folder)
                 sequencer.mode = "SEQ"
                 sequencer.update_display()
                 sequencer_global = sequencer
             
-                keypad._prev_key = None
+                keypad.clear()
                 
                 while True:
+                    sequencer.midi_in.poll()
                     direction = encoder.get_direction()
                     now = time.ticks_ms()
 
                     # BLOCK BLINKING CURSOR : DUAL MODE
                     if not sequencer.dual_mode and direction != 0:
-                        if direction != last_dir or time.ticks_diff(now, last_time) > 200:
-                            sequencer.current_step = (sequencer.current_step + direction) % 16
-                            sequencer.update_display()
-                            sequencer.blink_state = True
-                            sequencer.last_blink_time = now
-                            last_dir = direction
-                            last_time = now
+                        sequencer.current_step = (sequencer.current_step + direction) % sequencer.pattern.length
+                        sequencer.update_display()
+                        sequencer.blink_state = True
+                        sequencer.last_blink_time = now
 
                     key_event = keypad.get_key()
                     nav_event = navpad.get_key()
@@ -339,8 +267,7 @@ async def launch_program(program_index):
                         
                         if sequencer.dual_mode and not sequencer.running:
                             # KEY HANDLING : DUAL MODE [IDLE]
-                            sequencer.current_key = key_event
-                            await sequencer.handle_dual_mode_inputs()
+                            await sequencer.handle_dual_mode_inputs(key_event)
 
                         elif not sequencer.dual_mode :
                             await sequencer.assign_sample(key_event)
@@ -370,6 +297,8 @@ async def launch_program(program_index):
 
                     if encoder.get_button_press():
                         sequencer.stop_sequence()
+                        sequencer.shutdown()
+                        flush_programs()
                         return
 
                     await asyncio.sleep_ms(1)
@@ -379,39 +308,29 @@ async def launch_program(program_index):
 
             elif mode == "CONFIGURE":
                 await open_configure_menu(program_data)
+                flush_programs()
 
         await asyncio.sleep_ms(1)
 
 # BOOT CONDITIONS
 
-# tm_display.scroll("Hello Hello Hello Hello")
-# time.sleep(0.5)
-
-display_program(programs[current_program_index])
-
-last_direction = 0
-last_time = 0
+# SHOWN ONCE THE BOOT SCROLL HAS RUN
+display_program(programs[current_program_index], preempt=False)
 
 # PROGRAM CONFIGURATION MENU
 
 async def open_configure_menu(program_data):
-    config_options = ["BACK", "BPM", "WAVE", "CTRL", "MIDI", "SYNC"]
+    config_options = ["BACK", "BPM", "WAVE", "CTRL", "MIDI", "SYNC", "PULSE", "CLOCK"]
     config_index = 0
-    last_dir = 0
-    last_time = time.ticks_ms()
 
     display_mode(config_options[config_index])
 
     while True:
         display_mode(config_options[config_index])
         direction = encoder.get_direction()
-        now = time.ticks_ms()
         if direction != 0:
-            if direction != last_dir or time.ticks_diff(now, last_time) > 200:
-                config_index = (config_index + direction) % len(config_options)
-                last_dir = direction
-                last_time = now
-                display_mode(config_options[config_index])
+            config_index = (config_index + direction) % len(config_options)
+            display_mode(config_options[config_index])
 
         if encoder.get_button_press():
             selected = config_options[config_index]
@@ -423,18 +342,14 @@ async def open_configure_menu(program_data):
                 tm_display.number(bpm)
                 while True:
                     direction = encoder.get_direction()
-                    now = time.ticks_ms()
                     if direction != 0:
-                        if direction != last_dir or time.ticks_diff(now, last_time) > 200:
-                            bpm = max(60, min(140, bpm + direction))
-                            tm_display.number(bpm)
-                            last_dir = direction
-                            last_time = now
+                        bpm = max(60, min(140, bpm + direction))
+                        tm_display.number(bpm)
                     if encoder.get_button_press():
                         program_data["bpm"] = bpm
                         save_program(program_data)
                         break
-                    time.sleep_ms(10)
+                    await asyncio.sleep_ms(10)
 
             elif selected == "WAVE":
                 waveforms = ["SIN", "TRI", "SAW", "SQR"]
@@ -442,18 +357,14 @@ async def open_configure_menu(program_data):
                 display_mode(waveforms[current_index])
                 while True:
                     direction = encoder.get_direction()
-                    now = time.ticks_ms()
                     if direction != 0:
-                        if direction != last_dir or time.ticks_diff(now, last_time) > 200:
-                            current_index = (current_index + direction) % len(waveforms)
-                            display_mode(waveforms[current_index])
-                            last_dir = direction
-                            last_time = now
+                        current_index = (current_index + direction) % len(waveforms)
+                        display_mode(waveforms[current_index])
                     if encoder.get_button_press():
                         program_data["waveform"] = waveforms[current_index]
                         save_program(program_data)
                         break
-                    time.sleep_ms(10)
+                    await asyncio.sleep_ms(10)
 
             elif selected == "CTRL":
                 ctrl_options = ["DISABLED", "CUTOFF", "ASDR","ASDR_WAVE", "FILTER MOD", "FILTER SWEEP", "PITCH BEND"]
@@ -464,13 +375,9 @@ async def open_configure_menu(program_data):
                 display_mode(ctrl_options[current_index])
                 while True:
                     direction = encoder.get_direction()
-                    now = time.ticks_ms()
                     if direction != 0:
-                        if direction != last_dir or time.ticks_diff(now, last_time) > 200:
-                            current_index = (current_index + direction) % len(ctrl_options)
-                            display_mode(ctrl_options[current_index])
-                            last_dir = direction
-                            last_time = now
+                        current_index = (current_index + direction) % len(ctrl_options)
+                        display_mode(ctrl_options[current_index])
                     if encoder.get_button_press():
                         selected_ctrl = ctrl_options[current_index]
                         program_data["control"] = selected_ctrl
@@ -491,17 +398,17 @@ async def open_configure_menu(program_data):
                             program_data["control_value"] = 32767
 
                         display_mode("ON")
-                        time.sleep(1)
+                        await asyncio.sleep(1)
                         save_program(program_data)
                         break
-                    time.sleep_ms(10)
+                    await asyncio.sleep_ms(10)
 
             elif selected == "MIDI":
                 program_data["midi"] = not program_data.get("midi", False)
                 program_data["sync"] = False
                 display_mode("MIDI ON" if program_data["midi"] else "MIDI OFF")
                 save_program(program_data)
-                time.sleep(1)
+                await asyncio.sleep(1)
                 display_mode(config_options[config_index])
 
             elif selected == "SYNC":
@@ -509,23 +416,50 @@ async def open_configure_menu(program_data):
                 program_data["midi"] = False
                 display_mode("SYNC ON" if program_data["sync"] else "SYNC OFF")
                 save_program(program_data)
-                time.sleep(1)
+                await asyncio.sleep(1)
                 display_mode(config_options[config_index])
 
+            elif selected == "PULSE":
+                # SYNC PULSES PER STEP : 1 (VOLCA / PO) OR 2, OUT AND IN
+                pulses = program_data.get("sync_pulses", 1)
+                tm_display.number(pulses)
+                while True:
+                    direction = encoder.get_direction()
+                    if direction != 0:
+                        pulses = max(1, min(2, pulses + direction))
+                        tm_display.number(pulses)
+                    if encoder.get_button_press():
+                        program_data["sync_pulses"] = pulses
+                        save_program(program_data)
+                        break
+                    await asyncio.sleep_ms(10)
+
+            elif selected == "CLOCK":
+                sources = ["INT", "MIDI", "SYNC"]
+                current_source = program_data.get("clock", "INT")
+                current_index = sources.index(current_source) if current_source in sources else 0
+                display_mode("CLOCK " + sources[current_index])
+                while True:
+                    direction = encoder.get_direction()
+                    if direction != 0:
+                        current_index = (current_index + direction) % len(sources)
+                        display_mode("CLOCK " + sources[current_index])
+                    if encoder.get_button_press():
+                        program_data["clock"] = sources[current_index]
+                        save_program(program_data)
+                        break
+                    await asyncio.sleep_ms(10)
+
 # OPERATIONAL LOGIC
 
 async def main_loop():
-    global last_direction, last_time, running_program, current_program_index, sequencer_global
+    global running_program, current_program_index, sequencer_global
     while True:
         if not running_program:
             direction = encoder.get_direction()
-            current_time = time.ticks_ms()
             if direction != 0:
-                if direction != last_direction or time.ticks_diff(current_time, last_time) > 200:
-                    current_program_index = (current_program_index + direction) % len(programs)
-                    display_program(programs[current_program_index])
-                    last_direction = direction
-                    last_time = current_time
+                current_program_index = (current_program_index + direction) % len(programs)
+                display_program(programs[current_program_index])
 
             if encoder.get_button_press():
                 await launch_program(current_program_index)
@@ -0,0 +1,281 @@
+from machine import Timer
+from micropython import const
+from array import array
+import micropython
+import time
+from ringbuf import RingBuffer
+
+micropython.alloc_emergency_exception_buf(100)
+
+# MIDI CHANNEL VOICE
+MIDI_NOTE_OFF = const(0x80)
+MIDI_NOTE_ON = const(0x90)
+
+MIDI_PROGRAM_CHANGE = const(0xC0)
+MIDI_CHANNEL_PRESSURE = const(0xD0)
+
+# MIDI SYSTEM EXCLUSIVE / COMMON / REALTIME
+MIDI_SYSEX = const(0xF0)
+MIDI_SYSEX_END = const(0xF7)
+MIDI_TUNE_REQUEST = const(0xF6)
+MIDI_CLOCK = const(0xF8)
+MIDI_START = const(0xFA)
+MIDI_CONTINUE = const(0xFB)
+MIDI_STOP = const(0xFC)
+MIDI_SONG_POSITION = const(0xF2)
+MIDI_TIME_CODE = const(0xF1)
+MIDI_SONG_SELECT = const(0xF3)
+
+PPQN = const(24)
+TICKS_PER_STEP = const(6)  # 24 PPQN / 4 SIXTEENTHS PER BEAT
+
+RX_SLOTS = const(128)
+TX_BYTES = const(48)
+
+# SYNTH KEY IDS FOR INCOMING NOTES : CLEAR OF THE IDS GIVEN TO KEYPAD KEYS
+MIDI_KEY_BASE = const(0x100)
+OMNI = const(-1)
+
+class MidiClock:
+    def __init__(self, uart, bpm=80):
+        self.uart = uart
+        self.timer = Timer(-1)
+        self.running = False
+        self.ticks = 0
+        self.next_us = 0
+        self.remainder = 0
+
+        # PREALLOCATED MESSAGES : NOTHING IS BUILT INSIDE THE IRQ
+        self.clock_msg = bytes([MIDI_CLOCK])
+        self.start_msg = bytes([MIDI_START, MIDI_CLOCK])
+        self.continue_msg = bytes([MIDI_CONTINUE, MIDI_CLOCK])
+        self.stop_msg = bytes([MIDI_STOP])
+        self.position_msg = bytearray([MIDI_SONG_POSITION, 0, 0])
+
+        self._tick_cb = self._tick
+        self.set_bpm(bpm)
+        self.reset_jitter()
+
+    def set_bpm(self, bpm):
+        # MICROSECOND PERIOD : freq= WOULD ROUND TO WHOLE MILLISECONDS (31.25 MS -> 31 MS AT 80 BPM)
+        # THE FRACTION IS CARRIED IN remainder LIKE StepClock, SO 24 PULSES SPAN EXACTLY ONE BEAT
+        self.bpm = bpm
+        self.divisor = bpm * PPQN
+        self.period_us = 60_000_000 // self.divisor
+        self.period_rem = 60_000_000 % self.divisor
+        self.remainder = 0
+
+    def reset_jitter(self):
+        self.jitter_us = 0
+        self.max_jitter_us = 0
+        self.avg_jitter_us = 0
+
+    def _arm(self):
+        # ONE-SHOT TIMER RE-ARMED FOR THE NEXT ABSOLUTE DEADLINE : LATE PULSES DO NOT PUSH THE GRID BACK
+        self.remainder += self.period_rem
+        delta = self.period_us
+        if self.remainder >= self.divisor:
+            self.remainder -= self.divisor
+            delta += 1
+        self.next_us = time.ticks_add(self.next_us, delta)
+        delay = time.ticks_diff(self.next_us, time.ticks_us())
+        if delay < 1:
+            delay = 1  # BEHIND : SEND AT ONCE, A FOLLOWER COUNTS PULSES SO NONE IS SKIPPED
+        self.timer.init(mode=Timer.ONE_SHOT, period=delay, tick_hz=1_000_000, callback=self._tick_cb, hard=False)
+
+    def _tick(self, _):
+        # SOFT IRQ : ONE 0xF8 PER PULSE, INDEPENDENT OF THE PYTHON STEP LOOP
+        # SOFT ON PURPOSE : A HARD IRQ COULD RE-ENTER A uart.write() FROM SPP / START / MidiOut.flush().
+        # A SOFT CALLBACK RUNS BETWEEN BYTECODES, SO A PULSE IS LATE BY AT MOST ONE BLOCKING CALL
+        # (A FEW HUNDRED US, WELL UNDER THE ~1 MS RESOLUTION OF MOST FOLLOWERS) AND NEVER ACCUMULATES
+        if not self.running:
+            return
+        self.uart.write(self.clock_msg)
+        error = time.ticks_diff(time.ticks_us(), self.next_us)
+        self._arm()
+        if error < 0:
+            error = -error
+        self.jitter_us = error
+        if error > self.max_jitter_us:
+            self.max_jitter_us = error
+        self.avg_jitter_us = (self.avg_jitter_us * 15 + error) >> 4
+        self.ticks += 1
+
+    def song_position(self, sixteenths):
+        # SONG POSITION POINTER : 14-BIT COUNT OF MIDI BEATS (16TH NOTES)
+        self.position_msg[1] = sixteenths & 0x7F
+        self.position_msg[2] = (sixteenths >> 7) & 0x7F
+        self.uart.write(self.position_msg)
+
+    def _run(self, msg):
+        # START / CONTINUE IS FOLLOWED BY THE FIRST PULSE AT ONCE, THE TIMER KEEPS THE REST
+        self.timer.deinit()
+        self.ticks = 1
+        self.reset_jitter()
+        self.uart.write(msg)
+        self.next_us = time.ticks_us()
+        self.remainder = 0
+        self.running = True
+        self._arm()
+
+    def start(self):
+        self._run(self.start_msg)
+
+    def resume(self):
+        self._run(self.continue_msg)
+
+    def stop(self):
+        self.timer.deinit()
+        self.running = False
+        self.uart.write(self.stop_msg)
+
+    def jitter(self):
+        return self.jitter_us, self.avg_jitter_us, self.max_jitter_us
+
+# MIDI OUT : MESSAGES ARE ASSEMBLED IN ONE PREALLOCATED BUFFER AND SENT WITH A SINGLE WRITE
+class MidiOut:
+    def __init__(self, uart, channel=0):
+        self.uart = uart
+        self.channel = channel
+        self.buf = bytearray(TX_BYTES)
+        self.view = memoryview(self.buf)
+        self.length = 0
+        self.status = 0
+        self.messages = 0
+        self.writes = 0
+
+    def _message(self, status, data1, data2):
+        if self.length + 3 > TX_BYTES:
+            self.flush()
+        buf = self.buf
+        n = self.length
+        # RUNNING STATUS : REPEATED STATUS BYTES ARE LEFT OUT WITHIN A BATCH
+        if status != self.status:
+            buf[n] = status
+            n += 1
+            self.status = status
+        buf[n] = data1 & 0x7F
+        buf[n + 1] = data2 & 0x7F
+        self.length = n + 2
+        self.messages += 1
+
+    def note_on(self, note, velocity=100, channel=None):
+        self._message(MIDI_NOTE_ON | (self.channel if channel is None else channel), note, velocity)
+
+    def note_off(self, note, channel=None):
+        # SENT AS NOTE ON / VELOCITY 0 SO ONS AND OFFS SHARE ONE RUNNING STATUS
+        self._message(MIDI_NOTE_ON | (self.channel if channel is None else channel), note, 0)
+
+    def flush(self):
+        # EVERY BATCH STARTS WITH A FULL STATUS BYTE : OTHER WRITERS ON THE UART (CLOCK, SPP) CAN'T BREAK IT
+        if self.length:
+            self.uart.write(self.view[:self.length])
+            self.writes += 1
+            self.length = 0
+        self.status = 0
+
+# MIDI IN : THE RX IRQ ONLY TIMESTAMPS AND QUEUES BYTES, DECODING HAPPENS IN poll()
+class MidiIn:
+    def __init__(self, uart, channel=OMNI):
+        self.uart = uart
+        self.channel = channel
+        self.rx_buf = bytearray(32)
+        self.events = RingBuffer(RX_SLOTS, 'i', 2)
+        self.event = array('i', [0, 0])
+        self.clock = None  # REALTIME LISTENER : feed(status, t_us)
+        self.synth = None  # NOTE LISTENER : note_on(note, key, velocity) / note_off(key)
+
+        # PARSER STATE : CURRENT (RUNNING) STATUS, ITS DATA LENGTH, DATA BYTES STILL EXPECTED
+        self.status = 0
+        self.length = 0
+        self.needed = 0
+        self.data1 = 0
+        self.sysex = False
+        self.messages = 0
+        self._rx_cb = self._rx
+        self.enable()
+
+    def enable(self):
+        self.uart.irq(handler=self._rx_cb, trigger=self.uart.IRQ_RXIDLE, hard=False)
+
+    def disable(self):
+        self.uart.irq(handler=None)
+
+    def _rx(self, uart):
+        # ONE TIMESTAMP PER BURST : A LONE 0xF8 IS STAMPED A FIXED ~1 BYTE-TIME AFTER IT ARRIVED
+        now = time.ticks_us()
+        n = uart.readinto(self.rx_buf)
+        if n:
+            buf = self.rx_buf
+            for i in range(n):
+                self.events.put(buf[i], now)
+
+    def poll(self):
+        event = self.event
+        while self.events.get_into(event):
+            self.parse(event[0], event[1])
+
+    def parse(self, byte, t_us=0):
+        # INCREMENTAL, ONE BYTE AT A TIME, NO ALLOCATION
+        if byte >= MIDI_CLOCK:
+            # REALTIME : MAY ARRIVE BETWEEN ANY TWO BYTES AND LEAVES THE PARSER STATE ALONE
+            if self.clock is not None:
+                self.clock.feed(byte, t_us)
+            return
+
+        if byte & 0x80:
+            self.sysex = byte == MIDI_SYSEX
+            if byte >= MIDI_SYSEX:
+                # SYSEX / SYSTEM COMMON CANCEL RUNNING STATUS
+                if byte == MIDI_SONG_POSITION:
+                    self.status = byte
+                    self.length = 2
+                elif byte == MIDI_TIME_CODE or byte == MIDI_SONG_SELECT:
+                    self.status = byte
+                    self.length = 1
+                else:
+                    self.status = 0
+            else:
+                self.status = byte
+                kind = byte & 0xF0
+                self.length = 1 if kind == MIDI_PROGRAM_CHANGE or kind == MIDI_CHANNEL_PRESSURE else 2
+            self.needed = self.length
+            return
+
+        # DATA BYTE
+        status = self.status
+        if self.sysex or not status:
+            return
+        if self.needed == 2:
+            self.data1 = byte
+            self.needed = 1
+            return
+        if self.length == 2:
+            data1 = self.data1
+            data2 = byte
+        else:
+            data1 = byte
+            data2 = 0
+        if status >= MIDI_SYSEX:
+            self.status = 0
+        else:
+            # RUNNING STATUS : THE NEXT DATA BYTE STARTS ANOTHER MESSAGE OF THE SAME KIND
+            self.needed = self.length
+        self.messages += 1
+        self._dispatch(status, data1, data2)
+
+    def _dispatch(self, status, data1, data2):
+        if status == MIDI_SONG_POSITION:
+            if self.clock is not None:
+                self.clock.song_position(data1 | (data2 << 7))
+            return
+        kind = status & 0xF0
+        if kind != MIDI_NOTE_ON and kind != MIDI_NOTE_OFF:
+            return
+        if self.synth is None or (self.channel != OMNI and status & 0x0F != self.channel):
+            return
+        # NOTE ON WITH VELOCITY 0 IS A NOTE OFF
+        if kind == MIDI_NOTE_ON and data2:
+            self.synth.note_on(data1, MIDI_KEY_BASE + data1, data2)
+        else:
+            self.synth.note_off(MIDI_KEY_BASE + data1)
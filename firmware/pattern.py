@@ -0,0 +1,186 @@
+from micropython import const
+from array import array
+
+# STEP GRID : PARALLEL BYTE ARRAYS, ONE BYTE PER STEP PER PARAMETER, PLUS AN OCCUPANCY BITMASK
+MAX_STEPS = const(64)
+DEFAULT_STEPS = const(16)
+PAGE_STEPS = const(16)  # ONE DISPLAY PAGE = ONE 16-BIT OCCUPANCY WORD
+PAGES = const(4)
+
+EMPTY = const(0)  # SAMPLE SENTINEL : SAMPLE IDS START AT 1
+DEFAULT_VELOCITY = const(100)
+ALWAYS = const(255)  # PROBABILITY 255/255
+MAX_RATCHET = const(4)  # STORED LIMIT : PLAYBACK ALSO CAPS IT TO THE DFPLAYER'S FRAME GAP AT THE TEMPO
+
+# MELODIC TRACK : MIDI NOTE (0 = REST) + GATE IN EIGHTHS OF A STEP
+REST = const(0)
+DEFAULT_GATE = const(4)
+GATE_SHIFT = const(3)
+
+# SERIALIZED : length BYTES EACH OF SAMPLE, VELOCITY, PROBABILITY, RATCHET, NOTE OFFSET (SIGNED), NOTE, GATE
+FIELDS = const(7)
+SAMPLE_FIELDS = const(5)  # RECORDS WRITTEN BEFORE THE MELODIC TRACK
+
+class Pattern:
+    def __init__(self, length=DEFAULT_STEPS):
+        # WORDS STAY SMALL INTS (NO BIGINT ON MICROPYTHON) AT ANY LENGTH
+        self.occupied = array('H', [0] * PAGES)
+        self.length = 0
+        self.set_length(length)
+
+    def set_length(self, length):
+        # CONTENT OF THE COMMON STEPS IS KEPT, STEPS CUT OFF ARE GONE
+        length = max(1, min(MAX_STEPS, length))
+        if length == self.length:
+            return
+        old = self.length
+        samples = bytearray(length)
+        velocity = bytearray(length)
+        probability = bytearray(length)
+        ratchet = bytearray(length)
+        offset = bytearray(length)
+        notes = bytearray(length)
+        gates = bytearray(length)
+        for i in range(length):
+            if i < old:
+                samples[i] = self.samples[i]
+                velocity[i] = self.velocity[i]
+                probability[i] = self.probability[i]
+                ratchet[i] = self.ratchet[i]
+                offset[i] = self.offset[i]
+                notes[i] = self.notes[i]
+                gates[i] = self.gates[i]
+            else:
+                velocity[i] = DEFAULT_VELOCITY
+                probability[i] = ALWAYS
+                ratchet[i] = 1
+                gates[i] = DEFAULT_GATE
+        self.samples = samples
+        self.velocity = velocity
+        self.probability = probability
+        self.ratchet = ratchet
+        self.offset = offset
+        self.notes = notes
+        self.gates = gates
+        self.length = length
+        self._rebuild_mask()
+
+    def _rebuild_mask(self):
+        occupied = self.occupied
+        for page in range(PAGES):
+            occupied[page] = 0
+        samples = self.samples
+        for i in range(self.length):
+            if samples[i] != EMPTY:
+                occupied[i >> 4] |= 1 << (i & 15)
+
+    def set_step(self, step, sample, velocity=DEFAULT_VELOCITY, probability=ALWAYS, ratchet=1, offset=0):
+        self.samples[step] = sample
+        self.velocity[step] = velocity
+        self.probability[step] = probability
+        self.ratchet[step] = max(1, min(MAX_RATCHET, ratchet))
+        self.offset[step] = offset & 0xFF
+        if sample == EMPTY:
+            self.occupied[step >> 4] &= ~(1 << (step & 15))
+        else:
+            self.occupied[step >> 4] |= 1 << (step & 15)
+
+    def clear_step(self, step):
+        self.set_step(step, EMPTY)
+
+    def set_note(self, step, note, gate=DEFAULT_GATE):
+        self.notes[step] = note & 0x7F
+        self.gates[step] = max(1, min(255, gate))
+
+    def clear_note(self, step):
+        self.notes[step] = REST
+        self.gates[step] = DEFAULT_GATE
+
+    def clear(self):
+        for i in range(self.length):
+            self.set_step(i, EMPTY)
+            self.clear_note(i)
+
+    def is_set(self, step):
+        return (self.occupied[step >> 4] >> (step & 15)) & 1
+
+    def note_offset(self, step):
+        offset = self.offset[step]
+        return offset - 256 if offset & 0x80 else offset
+
+    def page_mask(self, page):
+        return self.occupied[page]
+
+    def count(self):
+        n = 0
+        for page in range(PAGES):
+            word = self.occupied[page]
+            while word:
+                word &= word - 1
+                n += 1
+        return n
+
+    def next_active(self, step):
+        # FIRST SET STEP AFTER step, WRAPPING (step ITSELF WHEN IT IS THE ONLY ONE), -1 WHEN EMPTY
+        occupied = self.occupied
+        n = self.length
+        i = step + 1
+        for _ in range(PAGES + 2):
+            if i >= n:
+                i = 0
+            word = occupied[i >> 4] >> (i & 15)
+            if word:
+                while not word & 1:
+                    word >>= 1
+                    i += 1
+                return i
+            i = (i | 15) + 1
+        return -1
+
+    def load(self, buf, pos, length, fields=FIELDS):
+        # IN PLACE WHEN THE LENGTH MATCHES : NO ALLOCATION ON A RELOAD
+        self.set_length(length)
+        _copy_in(self.samples, buf, pos, length)
+        _copy_in(self.velocity, buf, pos + length, length)
+        _copy_in(self.probability, buf, pos + 2 * length, length)
+        _copy_in(self.ratchet, buf, pos + 3 * length, length)
+        _copy_in(self.offset, buf, pos + 4 * length, length)
+        if fields > SAMPLE_FIELDS:
+            _copy_in(self.notes, buf, pos + 5 * length, length)
+            _copy_in(self.gates, buf, pos + 6 * length, length)
+        ratchet = self.ratchet
+        gates = self.gates
+        for i in range(length):
+            ratchet[i] = max(1, min(MAX_RATCHET, ratchet[i]))
+            if fields > SAMPLE_FIELDS:
+                gates[i] = max(1, gates[i])
+            else:
+                self.clear_note(i)
+        self._rebuild_mask()
+
+    def store(self, buf, pos):
+        length = self.length
+        _copy_out(self.samples, buf, pos, length)
+        _copy_out(self.velocity, buf, pos + length, length)
+        _copy_out(self.probability, buf, pos + 2 * length, length)
+        _copy_out(self.ratchet, buf, pos + 3 * length, length)
+        _copy_out(self.offset, buf, pos + 4 * length, length)
+        _copy_out(self.notes, buf, pos + 5 * length, length)
+        _copy_out(self.gates, buf, pos + 6 * length, length)
+        return pos + FIELDS * length
+
+    def load_list(self, sequence):
+        # LEGACY STEP LIST : None OR A SAMPLE ID PER STEP
+        self.set_length(len(sequence) if sequence else DEFAULT_STEPS)
+        for i in range(self.length):
+            sample = sequence[i] if sequence else None
+            self.set_step(i, EMPTY if sample is None else sample)
+        return self
+
+def _copy_in(data, buf, base, n):
+    for i in range(n):
+        data[i] = buf[base + i]
+
+def _copy_out(data, buf, base, n):
+    for i in range(n):
+        buf[base + i] = data[i]
@@ -1,29 +1,444 @@
+import uasyncio as asyncio
+from micropython import const
 import ujson
+import time
+import os
+from array import array
+from wavetables import WAVEFORMS, resolve
+from pattern import Pattern, FIELDS, SAMPLE_FIELDS, MAX_STEPS, DEFAULT_STEPS
 
-def save_program(program_data):
+# BINARY PROGRAM RECORD : FIXED HEADER + PATTERN, LITTLE-ENDIAN
+PROGRAM_EXT = ".prg"
+PROGRAM_VERSION = const(5)
+SONG_VERSION = const(3)  # FIRST VERSION WITH A SONG BLOCK
+TRACK_VERSION = const(4)  # FIRST VERSION WITH THE MELODIC TRACK (NOTE + GATE FIELDS)
+WIDE_VERSION = const(5)  # FIRST VERSION WITH THE 18-BYTE HEADER (U16 CONTROL VALUE)
+HEADER_SIZE = const(18)
+V4_HEADER_SIZE = const(16)  # V1-V4
+MAX_SONG = const(32)
+RECORD_SIZE = const(499)  # LARGEST RECORD : HEADER + 64 STEPS x 7 FIELDS + SONG LENGTH + 32 ENTRIES
+
+# V1 : 32 BYTES, 16 SAMPLE BYTES AFTER THE HEADER (READ FOR MIGRATION)
+V1_SIZE = const(32)
+V1_STEPS = const(16)
+
+# OFFSETS (V1 + V2)
+OFF_MAGIC = const(0)  # b"PR"
+OFF_VERSION = const(2)
+OFF_FLAGS = const(3)
+OFF_FOLDER = const(4)
+OFF_BANK = const(5)
+OFF_BPM = const(6)  # U16
+OFF_WAVEFORM = const(8)
+OFF_CONTROL = const(9)
+OFF_CONTROL_VALUE = const(10)  # V5 : LOW BYTE OF A U16, HIGH BYTE AT OFF_CONTROL_VALUE_HI
+OFF_OCTAVE = const(11)  # SIGNED
+OFF_CLOCK = const(12)
+OFF_MIDI_CHANNEL = const(13)
+OFF_SYNC_PULSES = const(14)
+OFF_LENGTH = const(15)  # V2 : PATTERN LENGTH (V1 : RESERVED)
+OFF_CONTROL_VALUE_HI = const(16)  # V5
+OFF_RESERVED = const(17)  # V5
+OFF_STEPS = const(18)  # V5 : pattern.Pattern.store() LAYOUT (V2-V4 : AT V4_HEADER_SIZE)
+# V1 : ONE SAMPLE BYTE PER STEP AT V4_HEADER_SIZE
+# V3 : AFTER THE STEPS, SONG LENGTH + ONE PATTERN INDEX PER SONG ENTRY
+# V4 : NOTE + GATE FIELDS ADDED TO THE STEPS (V2/V3 : 5 FIELDS)
+# V5 : HEADER GROWS TO 18 BYTES, CONTROL VALUE BECOMES A U16 (V1-V4 : ONE BYTE)
+
+# PATTERN FILES : <program>-<index>.pat = b"PT" + VERSION + LENGTH + pattern.Pattern.store() LAYOUT
+PATTERN_EXT = ".pat"
+PATTERN_VERSION = const(2)  # V1 : 5 FIELDS, NO MELODIC TRACK
+PATTERN_HEADER = const(4)
+PATTERNS = const(16)  # PER PROGRAM : PATTERN 0 LIVES IN THE PROGRAM RECORD, 1-15 IN PATTERN FILES
+
+FLAG_MIDI = const(1)
+FLAG_SYNC = const(2)
+
+# ENUMS : RECORD BYTE = INDEX (CONTROL INDEX = synthesizer MODE_* CODE)
+CONTROL_MODES = ("DISABLED", "CUTOFF", "ASDR", "ASDR_WAVE", "FILTER SWEEP", "FILTER MOD", "PITCH BEND")
+CLOCK_SOURCES = ("INT", "MIDI", "SYNC")
+
+# PREALLOCATED I/O BUFFERS
+_record = bytearray(RECORD_SIZE)
+_out = bytearray(RECORD_SIZE)
+_view = memoryview(_out)
+
+def _index(table, value):
+    return table.index(value) if value in table else 0
+
+def encode(program_data, buf):
+    buf[OFF_MAGIC] = 0x50
+    buf[OFF_MAGIC + 1] = 0x52
+    buf[OFF_VERSION] = PROGRAM_VERSION
+    buf[OFF_FLAGS] = (FLAG_MIDI if program_data.get("midi") else 0) | (FLAG_SYNC if program_data.get("sync") else 0)
+    buf[OFF_FOLDER] = program_data.get("folder", 1)
+    buf[OFF_BANK] = program_data.get("bank", 1)
+    bpm = program_data.get("bpm", 80)
+    buf[OFF_BPM] = bpm & 0xFF
+    buf[OFF_BPM + 1] = bpm >> 8
+    buf[OFF_WAVEFORM] = _index(WAVEFORMS, resolve(program_data.get("waveform", "SIN")))
+    buf[OFF_CONTROL] = _index(CONTROL_MODES, program_data.get("control", "DISABLED"))
+    control_value = max(0, min(0xFFFF, program_data.get("control_value", 0)))
+    buf[OFF_CONTROL_VALUE] = control_value & 0xFF
+    buf[OFF_CONTROL_VALUE_HI] = control_value >> 8
+    buf[OFF_RESERVED] = 0
+    buf[OFF_OCTAVE] = program_data.get("octave_shift", 0) & 0xFF
+    buf[OFF_CLOCK] = _index(CLOCK_SOURCES, program_data.get("clock", "INT"))
+    buf[OFF_MIDI_CHANNEL] = program_data.get("midi_channel", 1)
+    buf[OFF_SYNC_PULSES] = program_data.get("sync_pulses", 1)
+    pattern = program_data.get("pattern")
+    if pattern is None:
+        pattern = program_data["pattern"] = Pattern()
+    buf[OFF_LENGTH] = pattern.length
+    pos = pattern.store(buf, OFF_STEPS)
+    song = program_data.get("song", b"")
+    n = min(MAX_SONG, len(song))
+    buf[pos] = n
+    for i in range(n):
+        buf[pos + 1 + i] = song[i]
+    return pos + 1 + n
+
+def decode(buf, program_data, n=RECORD_SIZE):
+    # FIELDS ARE READ STRAIGHT OUT OF THE BUFFER INTO program_data (AN EXISTING PATTERN IS REUSED)
+    if n < V4_HEADER_SIZE or buf[OFF_MAGIC] != 0x50 or buf[OFF_MAGIC + 1] != 0x52:
+        raise ValueError("Not a program record")
+    version = buf[OFF_VERSION]
+    steps = OFF_STEPS if version >= WIDE_VERSION else V4_HEADER_SIZE
+    if version == 1:
+        if n != V1_SIZE:
+            raise ValueError("Truncated program record")
+    else:
+        length = buf[OFF_LENGTH]
+        end = steps + (FIELDS if version >= TRACK_VERSION else SAMPLE_FIELDS) * length
+        if version >= SONG_VERSION and n > end:
+            end += 1 + buf[end]
+        elif version >= SONG_VERSION:
+            end += 1  # SONG LENGTH BYTE MISSING : n != end BELOW
+        if version > PROGRAM_VERSION or not 1 <= length <= MAX_STEPS or n != end:
+            raise ValueError("Bad program record")
+    flags = buf[OFF_FLAGS]
+    program_data["midi"] = bool(flags & FLAG_MIDI)
+    program_data["sync"] = bool(flags & FLAG_SYNC)
+    program_data["folder"] = buf[OFF_FOLDER]
+    program_data["bank"] = buf[OFF_BANK]
+    program_data["bpm"] = buf[OFF_BPM] | (buf[OFF_BPM + 1] << 8)
+    program_data["waveform"] = WAVEFORMS[buf[OFF_WAVEFORM] % len(WAVEFORMS)]
+    program_data["control"] = CONTROL_MODES[buf[OFF_CONTROL] % len(CONTROL_MODES)]
+    program_data["control_value"] = buf[OFF_CONTROL_VALUE] | ((buf[OFF_CONTROL_VALUE_HI] << 8) if version >= WIDE_VERSION else 0)
+    octave = buf[OFF_OCTAVE]
+    program_data["octave_shift"] = octave - 256 if octave & 0x80 else octave
+    program_data["clock"] = CLOCK_SOURCES[buf[OFF_CLOCK] % len(CLOCK_SOURCES)]
+    program_data["midi_channel"] = buf[OFF_MIDI_CHANNEL]
+    program_data["sync_pulses"] = buf[OFF_SYNC_PULSES]
+    pattern = program_data.get("pattern")
+    if pattern is None:
+        pattern = program_data["pattern"] = Pattern()
+    fields = FIELDS if version >= TRACK_VERSION else SAMPLE_FIELDS
+    if version == 1:
+        pattern.set_length(V1_STEPS)
+        for i in range(V1_STEPS):
+            pattern.set_step(i, buf[steps + i])
+            pattern.clear_note(i)
+    else:
+        pattern.load(buf, steps, buf[OFF_LENGTH], fields)
+
+    # SONG : PATTERN INDEXES IN PLAY ORDER (EMPTY = LOOP THE CURRENT PATTERN)
+    pos = steps + fields * pattern.length
+    count = buf[pos] if version >= SONG_VERSION else 0
+    song = program_data.get("song")
+    if song is None or len(song) != count:
+        song = program_data["song"] = bytearray(count)
+    for i in range(count):
+        song[i] = buf[pos + 1 + i] % PATTERNS
+    return program_data
+
+def encode_pattern(pattern, buf):
+    buf[0] = 0x50
+    buf[1] = 0x54
+    buf[2] = PATTERN_VERSION
+    buf[3] = pattern.length
+    return pattern.store(buf, PATTERN_HEADER)
+
+def decode_pattern(buf, pattern, n):
+    length = buf[3]
+    fields = FIELDS if buf[2] == PATTERN_VERSION else SAMPLE_FIELDS
+    if n < PATTERN_HEADER or buf[0] != 0x50 or buf[1] != 0x54 or not 1 <= buf[2] <= PATTERN_VERSION \
+       or not 1 <= length <= MAX_STEPS or n != PATTERN_HEADER + fields * length:
+        raise ValueError("Bad pattern file")
+    pattern.load(buf, PATTERN_HEADER, length, fields)
+    return pattern
+
+# WRITE-BEHIND : EDITS ONLY MARK A PROGRAM DIRTY, THE FILE IS WRITTEN AFTER A QUIET PERIOD
+SAVE_DELAY_MS = const(2000)
+
+class ProgramStore:
+    def __init__(self, delay_ms=SAVE_DELAY_MS):
+        self.delay_ms = delay_ms
+        self.pending = {}  # PATH -> program_data OR Pattern
+        self.last_change = time.ticks_ms()
+        self.wake = asyncio.Event()
+        self._task = None
+        self.flush_allowed = True  # CLEARED BY THE SEQUENCER WHILE THE TRANSPORT RUNS
+
+        # STATS
+        self.requests = 0
+        self.flushes = 0
+        self.errors = 0
+        self.last_us = 0
+        self.max_us = 0
+        self.total_us = 0
+
+    def mark_dirty(self, program_data):
+        # NEVER TOUCHES FLASH : REPEATED EDITS TO ONE PROGRAM COLLAPSE INTO ONE WRITE
+        self._mark(_program_name(program_data) + PROGRAM_EXT, program_data)
+
+    def mark_pattern_dirty(self, program_name, index, pattern):
+        self._mark(pattern_path(program_name, index), pattern)
+
+    def _mark(self, path, item):
+        self.pending[path] = item
+        self.last_change = time.ticks_ms()
+        self.requests += 1
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_task())
+        self.wake.set()
+
+    def dirty(self):
+        return bool(self.pending)
+
+    def allow_flush(self, allowed):
+        # A FLASH ERASE / WRITE BLOCKS THE LOOP FOR MILLISECONDS : NO WRITE-BEHIND DURING PLAYBACK,
+        # EDITS MADE WHILE PLAYING ARE WRITTEN ONCE THE TRANSPORT STOPS (EXPLICIT flush() STILL WORKS)
+        self.flush_allowed = allowed
+        if allowed:
+            self.wake.set()
+
+    async def _flush_task(self):
+        while True:
+            if not self.pending or not self.flush_allowed:
+                self.wake.clear()
+                await self.wake.wait()
+                continue
+            quiet = time.ticks_diff(time.ticks_ms(), self.last_change)
+            if quiet < self.delay_ms:
+                await asyncio.sleep_ms(self.delay_ms - quiet)
+                continue
+            self.flush()
+            if self.pending:
+                # WRITE FAILED : RETRY AFTER ANOTHER QUIET PERIOD
+                self.last_change = time.ticks_ms()
+                await asyncio.sleep_ms(self.delay_ms)
+
+    def flush(self, path=None):
+        # SYNCHRONOUS : CALLED ON MODE EXIT / BEFORE A RELOAD OR EVICTION, AND BY THE BACKGROUND TASK
+        for key in list(self.pending):
+            if path is not None and key != path:
+                continue
+            start = time.ticks_us()
+            try:
+                _write_atomic(key, self.pending[key])
+            except OSError as e:
+                self.errors += 1
+                print("Program save failed:", key, e)
+                continue
+            del self.pending[key]
+            elapsed = time.ticks_diff(time.ticks_us(), start)
+            self.flushes += 1
+            self.last_us = elapsed
+            self.total_us += elapsed
+            if elapsed > self.max_us:
+                self.max_us = elapsed
+
+    def holds(self, item):
+        for key in self.pending:
+            if self.pending[key] is item:
+                return True
+        return False
+
+    def flush_item(self, item):
+        for key in list(self.pending):
+            if self.pending[key] is item:
+                self.flush(key)
+
+    def stats(self):
+        avg = self.total_us // self.flushes if self.flushes else 0
+        return {
+            "requests": self.requests,
+            "flushes": self.flushes,
+            "errors": self.errors,
+            "pending": len(self.pending),
+            "last_us": self.last_us,
+            "avg_us": avg,
+            "max_us": self.max_us,
+        }
+
+def _write_atomic(path, item):
+    # FULL WRITE TO A TEMP FILE, THEN RENAME : A POWER CUT LEAVES EITHER THE OLD OR THE NEW FILE
+    # (IN THE FAT FALLBACK THE NEW ONE MAY ONLY EXIST AS <path>.tmp : _read_record() PICKS IT UP)
+    tmp = path + ".tmp"
+    n = encode_pattern(item, _out) if isinstance(item, Pattern) else encode(item, _out)
+    with open(tmp, "wb") as f:
+        f.write(_view[:n])
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        # FAT WON'T RENAME OVER AN EXISTING FILE (LITTLEFS DOES)
+        os.remove(path)
+        os.rename(tmp, path)
+
+def _read_record(path, decoder, item):
+    # THE FILE ITSELF, ELSE A COMPLETE TEMP FILE FROM A WRITE CUT SHORT BETWEEN REMOVE AND RENAME
+    # RETURNS True WHEN THE TEMP FILE WAS USED (THE CALLER SCHEDULES A REWRITE), RAISES WHEN NEITHER DECODES
+    try:
+        with open(path, "rb") as f:
+            n = f.readinto(_record)
+        decoder(_record, item, n)
+        return False
+    except (OSError, ValueError):
+        with open(path + ".tmp", "rb") as f:
+            n = f.readinto(_record)
+        decoder(_record, item, n)
+        return True
+
+def _program_name(program_data):
     name = program_data.get("program")
     if not name:
         folder = program_data.get("folder", 1)
         name = f"P{folder}"
         program_data["program"] = name
-    with open(f"{name}.json", "w") as f:
-        ujson.dump(program_data, f)
+    return name
+
+store = ProgramStore()
+
+def save_program(program_data):
+    store.mark_dirty(program_data)
+
+def flush_programs():
+    store.flush()
+
+def pattern_path(program_name, index):
+    return f"{program_name}-{index}{PATTERN_EXT}"
+
+def save_pattern(program_data, index, pattern):
+    # PATTERN 0 IS PART OF THE PROGRAM RECORD, THE REST ARE WRITTEN BEHIND TO THEIR OWN FILES
+    if index == 0:
+        store.mark_dirty(program_data)
+    else:
+        store.mark_pattern_dirty(_program_name(program_data), index, pattern)
+
+def load_pattern(program_name, index, pattern):
+    # IN PLACE : A MISSING FILE IS AN EMPTY PATTERN
+    path = pattern_path(program_name, index)
+    store.flush(path)
+    try:
+        if _read_record(path, decode_pattern, pattern):
+            store.mark_pattern_dirty(program_name, index, pattern)
+        return pattern
+    except (OSError, ValueError):
+        pattern.set_length(DEFAULT_STEPS)
+        pattern.clear()
+        return pattern
+
+# PATTERN CACHE : PATTERNS 1-15 ARE DECODED ON DEMAND INTO A FEW RESIDENT SLOTS, LEAST RECENTLY USED GOES FIRST
+PATTERN_SLOTS = const(4)
+
+class PatternCache:
+    def __init__(self, slots=PATTERN_SLOTS):
+        self.patterns = [Pattern() for _ in range(slots)]
+        self.index = array('b', [-1] * slots)
+        self.used = array('H', [0] * slots)
+        self.clock = 0
+        self.program_data = None
+        self.hits = 0
+        self.misses = 0
+
+    def bind(self, program_data):
+        # NEW PROGRAM : EVERY SLOT IS STALE (ITS PENDING WRITES STAY QUEUED UNDER THEIR OWN PATHS)
+        self.program_data = program_data
+        for slot in range(len(self.index)):
+            self.index[slot] = -1
+
+    def get(self, index):
+        if index == 0:
+            return self.program_data["pattern"]
+        self.clock = (self.clock + 1) & 0xFFFF
+        slots = self.index
+        for slot in range(len(slots)):
+            if slots[slot] == index:
+                self.used[slot] = self.clock
+                self.hits += 1
+                return self.patterns[slot]
+
+        # MISS : REUSE THE OLDEST SLOT WITH NO WRITE PENDING (AGE MODULO 16 BITS), SO A FETCH DURING
+        # PLAYBACK READS FLASH BUT NEVER WRITES IT ; THE OLDEST SLOT OVERALL ONLY WHEN EVERY ONE IS DIRTY
+        victim = -1
+        oldest = -1
+        dirty = 0
+        dirty_oldest = -1
+        for slot in range(len(slots)):
+            if slots[slot] < 0:
+                victim = slot
+                break
+            age = (self.clock - self.used[slot]) & 0xFFFF
+            if store.holds(self.patterns[slot]):
+                if age > dirty_oldest:
+                    dirty_oldest = age
+                    dirty = slot
+            elif age > oldest:
+                oldest = age
+                victim = slot
+        if victim < 0:
+            victim = dirty
+        pattern = self.patterns[victim]
+
+        # THE EVICTED PATTERN MAY STILL BE WAITING TO BE WRITTEN : IT LANDS BEFORE ITS OBJECT IS REUSED
+        store.flush_item(pattern)
+        slots[victim] = index
+        self.used[victim] = self.clock
+        self.misses += 1
+        return load_pattern(_program_name(self.program_data), index, pattern)
+
+def load_program(program_name, program_data=None):
+    # BINARY RECORD FIRST, LEGACY JSON AS A ONE-TIME IMPORT, DEFAULTS OTHERWISE
+    # A PENDING WRITE FOR THIS PROGRAM LANDS FIRST, SO THE FILE IS NEVER STALE
+    store.flush(program_name + PROGRAM_EXT)
+    if program_data is None:
+        program_data = {}
+    migrate = False
+    try:
+        recovered = _read_record(program_name + PROGRAM_EXT, decode, program_data)
+        migrate = recovered or _record[OFF_VERSION] < PROGRAM_VERSION
+    except (OSError, ValueError):
+        import_json(program_name, program_data)
+    program_data["program"] = program_name
+    program_data["folder"] = int(program_name[1:])
+    if migrate:
+        # OLDER OR RECOVERED RECORD : REWRITTEN IN THE CURRENT LAYOUT ON THE NEXT FLUSH
+        store.mark_dirty(program_data)
+    return program_data
 
-def load_program(program_name):
-    folder_number = int(program_name[1:])
+def import_json(program_name, program_data):
     try:
         with open(f"{program_name}.json", "r") as f:
             data = ujson.load(f)
-    except:
+    except (OSError, ValueError):
         data = {}
-    return {
-        "program": program_name,
-        "folder": folder_number,
-        "bpm": data.get("bpm", 80),
-        "waveform": data.get("waveform", "SIN"),
-        "control": data.get("control", "DISABLED"),
-        "control_value": data.get("control_value", 0),
-        "sequence": data.get("sequence", [None] * 16),
-        "midi": data.get("midi", False),
-        "sync": data.get("sync", False)
-    }
+    program_data["folder"] = data.get("folder", 1)
+    program_data["bank"] = data.get("bank", 1)
+    program_data["bpm"] = data.get("bpm", 80)
+    program_data["waveform"] = data.get("waveform", "SIN")
+    program_data["control"] = data.get("control", "DISABLED")
+    program_data["control_value"] = data.get("control_value", 0)
+    program_data["octave_shift"] = data.get("octave_shift", 0)
+    program_data["pattern"] = Pattern().load_list(data.get("sequence"))
+    program_data["song"] = bytearray(0)
+    program_data["midi"] = data.get("midi", False)
+    program_data["sync"] = data.get("sync", False)
+    program_data["clock"] = data.get("clock", "INT")
+    program_data["midi_channel"] = data.get("midi_channel", 1)
+    program_data["sync_pulses"] = data.get("sync_pulses", 1)
+    if data:
+        # MIGRATE : THE BINARY RECORD IS WRITTEN ON THE NEXT FLUSH
+        program_data["program"] = program_name
+        store.mark_dirty(program_data)
+    return program_data
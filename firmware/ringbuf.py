@@ -0,0 +1,65 @@
+from array import array
+
+# SINGLE-PRODUCER / SINGLE-CONSUMER RING : ONLY THE PRODUCER MOVES head, ONLY THE CONSUMER MOVES tail
+# SAFE ACROSS CORES AND FROM IRQ HANDLERS WITHOUT LOCKS, NO ALLOCATION AFTER CONSTRUCTION
+class RingBuffer:
+    def __init__(self, size, typecode='B', width=1):
+        if size & (size - 1):
+            raise ValueError("Ring size must be a power of two")
+        self.data = array(typecode, [0] * (size * width))
+        self.width = width
+        self.mask = size - 1
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+
+    def any(self):
+        return (self.head - self.tail) & self.mask
+
+    def free(self):
+        return (self.tail - self.head - 1) & self.mask
+
+    def put(self, a, b=0, c=0, d=0):
+        head = self.head
+        nxt = (head + 1) & self.mask
+        if nxt == self.tail:
+            # FULL : DROP THE NEWEST RECORD, NEVER BLOCK THE PRODUCER
+            self.dropped += 1
+            return False
+        width = self.width
+        i = head * width
+        data = self.data
+        data[i] = a
+        if width > 1:
+            data[i + 1] = b
+            if width > 2:
+                data[i + 2] = c
+                if width > 3:
+                    data[i + 3] = d
+        self.head = nxt
+        return True
+
+    def get(self):
+        # SINGLE-WORD RECORDS : RETURNS -1 WHEN EMPTY
+        tail = self.tail
+        if tail == self.head:
+            return -1
+        value = self.data[tail * self.width]
+        self.tail = (tail + 1) & self.mask
+        return value
+
+    def get_into(self, out):
+        # MULTI-WORD RECORDS : COPIES ONE RECORD INTO out, RETURNS False WHEN EMPTY
+        tail = self.tail
+        if tail == self.head:
+            return False
+        width = self.width
+        i = tail * width
+        data = self.data
+        for k in range(width):
+            out[k] = data[i + k]
+        self.tail = (tail + 1) & self.mask
+        return True
+
+    def clear(self):
+        self.tail = self.head
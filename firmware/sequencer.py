@@ -2,12 +2,32 @@ import uasyncio as asyncio
 import time
 import ujson
 # from tremolo2 import TremoloController
-from machine import Timer, Pin
-from program_io import save_program
-from synthesizer27 import Synthesizer
+from machine import Timer
+from program_io import save_program, save_pattern, store, PatternCache, PATTERNS, MAX_SONG
+from synthesizer import Synthesizer, KEY_NOTES
+from clock import StepClock, ExternalClock
+from midi import MidiClock, MidiIn, MidiOut, TICKS_PER_STEP
+from sync import SyncOut, SyncIn, SYNC_IN_PIN
+from pattern import Pattern, EMPTY, ALWAYS, REST, GATE_SHIFT
+from random import getrandbits
+
+# STOP POLLING INPUT THIS CLOSE TO A STEP DEADLINE, THE CLOCK SPINS THE REST
+INPUT_GUARD_US = 4000
+
+# SONG MODE : THE NEXT PATTERN IS FETCHED IN THE INPUT WINDOW THIS MANY STEPS BEFORE THE BOUNDARY
+PREFETCH_STEPS = 2
+
+# MIDI NOTE OUT : SAMPLE STEPS ON THE DRUM CHANNEL (SAMPLE 1 = GM KICK), SYNTH KEYS ON midi_channel
+DRUM_CHANNEL = 9
+DRUM_NOTE_BASE = 36
+STEP_VELOCITY = 100
+
+# SYNTH KEY IDS FOR THE MELODIC TRACK : ONE PER STEP, CLEAR OF KEYPAD AND MIDI IN (midi.MIDI_KEY_BASE) IDS
+TRACK_KEY_BASE = 0x200
 
 class Sequencer:
-    def __init__(self, encoder, display, audio, keypad, navpad, midi_uart, program_data):
+    # LONG-LIVED : BUILT ONCE AT BOOT, RE-POINTED AT A PROGRAM WITH set_program()
+    def __init__(self, encoder, display, audio, keypad, navpad, midi_uart, program_data=None, synth=None, sync_in_pin=SYNC_IN_PIN):
         self.encoder = encoder
         self.display = display
         self.audio = audio
@@ -15,65 +35,192 @@ class Sequencer:
         self.navpad = navpad
         # self.tremolo = tremolo
         self.midi_uart = midi_uart
+        self.running = False
+        self.mode = "SEQ"
+        self.sync = SyncOut(pin_id=20, uart=midi_uart, rx_pin_id=21)  # SHARES GP20 WITH MIDI TX
+        self.sync_in_pin = sync_in_pin  # CLOCK IN JACK, OPENED ON FIRST USE
+        self.timer = Timer(-1)
+        self.midi_clock = MidiClock(midi_uart)
+        self.midi_in = MidiIn(midi_uart)
+        self.midi_out = MidiOut(midi_uart)
+        self.synth = synth if synth is not None else Synthesizer(program_data=program_data)
+        self.midi_in.synth = self.synth
+
+        # CLOCKS : ONE PER SOURCE, BUILT ON FIRST USE AND KEPT
+        self.step_clock = StepClock()
+        self.midi_follow = None
+        self.sync_in = None
+        self.sync_follow = None
+        self.clock = self.step_clock
+        self.clock_source = "INT"
+        self.external_clock = False
+
+        self.keymap = {
+            '1': 1, '2': 2, '3': 3, 'A': 4,
+            '5': 5, '6': 6, '7': 7, 'B': 8,
+            '9': 9, '10': 10, '11': 11, 'C': 12,
+            '13': 13, '14': 14, '15': 15, 'D': 16
+        }
+        self.ratchet_left = 0
+        self.ratchet_gap_us = 0
+        self.ratchet_us = 0
+        self.ratchet_sample = EMPTY
+
+        # MELODIC TRACK : THE STEP WHOSE NOTE IS ALREADY QUEUED IN THE SYNTH
+        self.track_pattern = None
+        self.track_step = 0
+        self.track_sent = False
+
+        # SONG MODE : PATTERNS 1-15 COME FROM FLASH THROUGH A SMALL LRU, THE NEXT ONE IS FETCHED A STEP EARLY
+        self.patterns = PatternCache()
+        self.pattern_index = 0
+        self.pattern_start = 0
+        self.song_pos = 0
+        self.next_pattern = None
+        self.next_index = 0
+        self.next_song_pos = 0
+        if program_data is not None:
+            self.set_program(program_data)
+        else:
+            self.midi_in.disable()  # PARKED UNTIL A PROGRAM IS SET
+
+    def set_program(self, program_data):
+        # NOTHING IS REBUILT : PATTERN, TEMPO, CHANNEL AND CLOCK SOURCE FOLLOW THE PROGRAM
         self.program_data = program_data
-        self.sequence = self.program_data.get("sequence", [None] * 16)
+        self.patterns.bind(program_data)
+        self.pattern = self._program_pattern()
+        self.pattern_index = 0
+        self.song = self.program_data.get("song", b"")
+        self.next_pattern = None
         self.running = False
         self.folder = self.program_data.get("folder", 1)
-        self.mode = "SEQ"
         self.bpm = self.program_data.get("bpm", 80)
         self.blink_state = True
         self.dual_mode = False
-        self.sync_pin = Pin(20, Pin.OUT)
-        self.timer = Timer(-1)
-        self.synth = Synthesizer(program_data=program_data)
+        self.midi_clock.set_bpm(self.bpm)
+        self.midi_out.channel = self.program_data.get("midi_channel", 1) - 1
+        self.step_note = -1
+        self.key_notes = {}
         self.current_step = 0
-        self.current_key = None
-        self.last_encoder_check = 0
-        self.last_drawn_step = None
+        self.held_keys = []
         self.last_blink_time = time.ticks_ms()
         self.last_toggle = 0
-        self.last_key_event = None
-        self.last_key_time = 0
-        self.note_map = {
-            '1': 261.63, '2': 293.66, '3': 329.63, 'A': 349.23,
-            '4': 392.00, '5': 440.00, '6': 493.88, 'B': 523.25,
-            '7': 554.37, '8': 587.33, '9': 622.25, 'C': 659.25,
-            '10': 698.46, '11': 739.99, '12': 783.99, 'D': 830.61
-        }
-        self.keymap = {
-            '1': 1, '2': 2, '3': 3, 'A': 4,
-            '4': 5, '5': 6, '6': 7, 'B': 8,
-            '7': 9, '8': 10, '9': 11, 'C': 12,
-            '10': 13, '11': 14, '12': 15, 'D': 16
-        }
+        self.synth.set_program(program_data)
+        self.select_clock(self.program_data.get("clock", "INT"))
+        self.midi_in.enable()
+
+    def select_clock(self, source):
+        # CLOCK SOURCE : INTERNAL MASTER, OR SLAVE TO MIDI CLOCK / ANALOG SYNC PULSES
+        self.midi_in.clock = None
+        if self.sync_in is not None:
+            self.sync_in.disable()
+        if source == "MIDI":
+            if self.midi_follow is None:
+                self.midi_follow = ExternalClock(self.midi_in, TICKS_PER_STEP)
+            self.midi_in.clock = self.midi_follow
+            self.clock = self.midi_follow
+            self.clock.reset()
+        elif source == "SYNC":
+            pulses = self.program_data.get("sync_pulses", 1)
+            if self.sync_in is None:
+                self.sync_in = SyncIn(pin_id=self.sync_in_pin)
+                self.sync_follow = ExternalClock(self.sync_in, pulses, freq_shift=1, auto_start=True)
+            else:
+                self.sync_in.enable()
+            self.clock = self.sync_follow
+            self.clock.reset()
+            self.clock.ticks_per_step = pulses
+        else:
+            source = "INT"
+            self.step_clock.set_bpm(self.bpm)
+            self.clock = self.step_clock
+        self.clock_source = source
+        self.external_clock = source != "INT"
+
+    def _program_pattern(self):
+        pattern = self.program_data.get("pattern")
+        if pattern is None:
+            pattern = self.program_data["pattern"] = Pattern()
+        return pattern
+
+    def select_pattern(self, index):
+        # EDIT ANOTHER PATTERN OF THIS PROGRAM (LOADED FROM FLASH ON A CACHE MISS)
+        if self.running:
+            return
+        self.pattern_index = index % PATTERNS
+        self.pattern = self.patterns.get(self.pattern_index)
+        self.current_step %= self.pattern.length
+        self.update_display()
+
+    def set_song(self, indexes):
+        song = bytearray(min(MAX_SONG, len(indexes)))
+        for i in range(len(song)):
+            song[i] = indexes[i] % PATTERNS
+        self.program_data["song"] = self.song = song
+        save_program(self.program_data)
+
+    def store_pattern(self):
+        save_pattern(self.program_data, self.pattern_index, self.pattern)
+
+    def start_song(self):
+        self.song_pos = 0
+        self.pattern_start = 0
+        self.next_pattern = None
+        if self.song:
+            self.pattern_index = self.song[0]
+            self.pattern = self.patterns.get(self.pattern_index)
+
+    def prepare_next(self):
+        # CALLED FROM THE INPUT WINDOW BEFORE THE BOUNDARY : FETCH (LRU HIT OR FLASH READ) THE PATTERN THAT PLAYS NEXT
+        song = self.song
+        if song:
+            self.next_song_pos = (self.song_pos + 1) % len(song)
+            self.next_index = song[self.next_song_pos]
+        else:
+            self.next_song_pos = 0
+            self.next_index = self.pattern_index
+        self.next_pattern = self.patterns.get(self.next_index)
+
+    def song_step(self, clock_step):
+        # STEP IN THE CURRENT PATTERN FOR A CLOCK STEP : A BOUNDARY ONLY SWAPS IN THE PREPARED PATTERN
+        step = clock_step - self.pattern_start
+        if step < 0:
+            # CLOCK RESTARTED (MIDI START) : SONG FROM THE TOP
+            self.start_song()
+            step = clock_step
+        length = self.pattern.length
+        if step >= 2 * length:
+            # FAR JUMP (SONG POSITION POINTER) : STAY ON THIS PATTERN
+            self.pattern_start = clock_step - step % length
+            step %= length
+        while step >= self.pattern.length:
+            step -= self.pattern.length
+            self.pattern_start += self.pattern.length
+            if self.next_pattern is None:
+                # NOT PREFETCHED (SKIPPED STEPS / NO INPUT WINDOW) : FETCHED LATE, STILL WITHOUT A FLASH WRITE
+                self.prepare_next()
+            self.pattern = self.next_pattern
+            self.pattern_index = self.next_index
+            self.song_pos = self.next_song_pos
+            self.next_pattern = None
+        return step
 
     def set_folder(self, folder_number):
-        self.sequence = self.program_data.get("sequence", [None] * 16)
+        self.pattern = self._program_pattern()
         self.folder = folder_number
 
     def update_display(self):
-        self.display.clear()
-        for i, sample in enumerate(self.sequence):
-            if sample is not None:
-                row, col = self.map_step_to_row_col(i)
-                if row == 0:
-                    self.display.set_top(col, 1)
-                else:
-                    self.display.set_bottom(col, 1)
-
-        row, col = self.map_step_to_row_col(self.current_step)
+        # THE CURSOR'S 16-STEP PAGE : OCCUPANCY WORD + CURSOR BIT, THE DRIVER ONLY SENDS DIGITS THAT CHANGED
+        step = self.current_step
+        mask = self.pattern.page_mask(step >> 4)
+        bit = 1 << (step & 15)
         if self.running:
-            if row == 0:
-                self.display.set_top(col, 1)
-            else:
-                self.display.set_bottom(col, 1)
-        elif not self.dual_mode and self.sequence[self.current_step] is None:
-            if row == 0:
-                self.display.set_top(col, 1 if self.blink_state else 0)
-            else:
-                self.display.set_bottom(col, 1 if self.blink_state else 0)
-
-        self.display.show()
+            mask |= bit
+        elif not self.dual_mode and self.blink_state:
+            mask |= bit
+        self.display.set_steps(mask)
+        # WHILE RUNNING THE CURSOR OWNS THE DISPLAY : IT CUTS ANY ANIMATION SHORT
+        self.display.show(preempt=self.running)
 
     def update_idle_visual(self):
         if self.running or self.dual_mode:
@@ -90,8 +237,11 @@ class Sequencer:
         self.last_toggle = time.ticks_ms()
         self.blink_state = not self.dual_mode
         if not self.dual_mode:
-            self.synth.stop_note()
-            self.current_key = None
+            self.synth.all_notes_off()
+            for key in self.held_keys:
+                self.send_key_note_off(key)
+            self.midi_out.flush()
+            self.held_keys = []
         self.update_display()
 
     async def assign_sample(self, key):
@@ -99,31 +249,30 @@ class Sequencer:
         if key_str not in self.keymap:
             return  # IGNORE GHOST KEYS
         sample_id = self.keymap[key_str]
-        self.sequence[self.current_step] = sample_id
-        save_program(self.program_data)
+        self.pattern.set_step(self.current_step, sample_id)
+        self.store_pattern()
         await self.audio.play(self.folder, sample_id)
         self.update_display()
 
     async def run_sequence(self, _):
-        interval = 60 / (self.bpm * 4)
         self.running = True
+        store.allow_flush(False)  # EDITS WHILE PLAYING ARE SAVED WHEN THE TRANSPORT STOPS
         self.current_step = 0
-
-        if self.program_data.get("midi"):
-            self.start_midi_clock()
-        elif self.program_data.get("sync"):
-            self.start_sync_pulse()
-
+        self.start_song()
+
+        # AS SLAVE THE MASTER OWNS TEMPO AND TRANSPORT : NO CLOCK / SYNC IS SENT
+        if not self.external_clock:
+            self.clock.set_bpm(self.bpm)
+            if self.program_data.get("midi"):
+                self.start_midi_clock()
+            elif self.program_data.get("sync"):
+                self.start_sync_pulse()
+
+        # STEP DEADLINES ARE ABSOLUTE : TIME SPENT ON INPUT / IO NEVER PUSHES THE GRID BACK
+        self.clock.start()
         while self.running:
-            step_val = self.sequence[self.current_step]
-            if step_val is not None:
-                await self.audio.play(self.folder, step_val)
-
-            self.update_display()
-            self.last_drawn_step = self.current_step
-            start_time = time.ticks_ms()
-
-            while time.ticks_diff(time.ticks_ms(), start_time) < int(interval * 1000):
+            while self.running and self.clock.remaining_us() > INPUT_GUARD_US:
+                self.midi_in.poll()
                 key_event = self.keypad.get_key()
                 nav_event = self.navpad.get_key()
                 now = time.ticks_ms()
@@ -134,29 +283,20 @@ class Sequencer:
                         break
                     elif nav_event == '19':
                         self.clear_entire_pattern()
-                        break
                     elif nav_event == '18':
                         self.clear_step()
-                        break
                     elif nav_event == '17' and time.ticks_diff(now, self.last_toggle) > 250:
                         await self.toggle_dual_mode()
 
                 elif key_event:
-                    if key_event != self.last_key_event or time.ticks_diff(now, self.last_key_time) > 400:
-                        self.last_key_event = key_event
-                        self.last_key_time = now
-                        if self.dual_mode:
-                            if key_event in self.note_map:
-                                if key_event != self.current_key:
-                                    self.synth.stop_note()
-                                    self.current_key = key_event
-                                    self.synth.start_note(self.note_map[key_event])
-                        else:
-                            await self.assign_sample(key_event)
-
-                if self.dual_mode and self.current_key and not self.keypad.is_pressed(self.current_key):
-                    self.synth.stop_note()
-                    self.current_key = None
+                    # ONE EVENT PER PRESS FROM THE SCANNER : NO REPEAT FILTERING NEEDED
+                    if self.dual_mode:
+                        self.press_synth_key(key_event)
+                    else:
+                        await self.assign_sample(key_event)
+
+                if self.dual_mode and self.held_keys:
+                    self.release_synth_keys()
 
                 direction = self.encoder.get_direction()
                 if self.dual_mode and direction:
@@ -166,71 +306,201 @@ class Sequencer:
                     self.stop_sequence()
                     return
 
-                time.sleep_ms(5)
+                if self.ratchet_left:
+                    await self.play_ratchet()
 
-            self.current_step = (self.current_step + 1) % 16
+                # NEXT PATTERN FROM THE LRU / FLASH HERE, A STEP EARLY, NOT ON THE BOUNDARY ITSELF
+                if self.next_pattern is None and self.current_step >= self.pattern.length - PREFETCH_STEPS:
+                    self.prepare_next()
 
-        if self.program_data.get("midi"):
+                await asyncio.sleep_ms(1)
+
+            if not self.running:
+                break
+            await self.clock.wait()
+            if not self.clock.due():
+                # EXTERNAL MASTER STOPPED OR SLOWED : BACK TO INPUT UNTIL THE NEXT DEADLINE
+                continue
+
+            step = self.current_step = self.song_step(self.clock.step)
+            self.clock.tick()
+            self.sync.step(self.clock.deadline_us())
+            await self.play_step(step)
+
+            self.update_display()
+            self.play_track(step)
+
+        if self.midi_clock.running:
             self.stop_midi_clock()
-        elif self.program_data.get("sync"):
+        elif self.sync.active:
             self.stop_sync_pulse()
+        self.ratchet_left = 0
+        self.send_step_notes(EMPTY)
+        self.stop_track()
+        store.allow_flush(True)
+
+    async def play_step(self, step):
+        pattern = self.pattern
+        sample = pattern.samples[step]
+        probability = pattern.probability[step]
+        if sample != EMPTY and probability != ALWAYS and getrandbits(8) >= probability:
+            sample = EMPTY  # STEP SKIPPED THIS TIME ROUND
+        self.ratchet_left = 0
+        if sample != EMPTY:
+            await self.audio.play(self.folder, sample)
+            # THE DFPLAYER TAKES ONE FRAME PER min_gap_ms : MORE REPEATS THAN FIT IN THE STEP WOULD BE
+            # DELAYED OR MERGED IN ITS TX QUEUE AND PUSH THE NEXT STEP LATE, SO THE COUNT IS CAPPED
+            # (50 MS GAP : 4x UP TO 75 BPM, 3x UP TO 100 BPM, 2x UP TO 150 BPM)
+            ratchet = min(pattern.ratchet[step], self.clock.interval_us // (self.audio.min_gap_ms * 1000))
+            if ratchet > 1:
+                # REPEATS SPLIT THE STEP EVENLY, FIRED FROM THE INPUT LOOP
+                self.ratchet_left = ratchet - 1
+                self.ratchet_gap_us = self.clock.interval_us // ratchet
+                self.ratchet_us = time.ticks_add(time.ticks_us(), self.ratchet_gap_us)
+                self.ratchet_sample = sample
+        if self.program_data.get("midi"):
+            self.send_step_notes(sample, pattern.velocity[step], pattern.note_offset(step))
+
+    async def play_ratchet(self):
+        if time.ticks_diff(time.ticks_us(), self.ratchet_us) < 0:
+            return
+        self.ratchet_left -= 1
+        self.ratchet_us = time.ticks_add(self.ratchet_us, self.ratchet_gap_us)
+        await self.audio.play(self.folder, self.ratchet_sample)
+
+    def play_track(self, step):
+        # SYNTH NOTES GO OUT ONE STEP EARLY, STAMPED WITH THEIR STEP'S DEADLINE : THE AUDIO WORKER STARTS
+        # AND STOPS THEM ON TIME, WHATEVER THIS LOOP IS DOING WHEN THE STEP COMES ROUND
+        pattern = self.pattern
+        if self.track_pattern is not pattern or self.track_step != step:
+            # NOT SENT AHEAD (FIRST STEP, SKIPPED STEPS, NO PREDICTED DEADLINE) : PLAY IT NOW
+            self.send_track_note(pattern, step, time.ticks_us())
+        if step == pattern.length - 1:
+            pattern = self.next_pattern
+            step = 0
+        else:
+            step += 1
+        deadline = self.clock.deadline_us()
+        if deadline is None or pattern is None:
+            self.track_pattern = None
+            return
+        self.track_pattern = pattern
+        self.track_step = step
+        self.send_track_note(pattern, step, deadline)
+
+    def send_track_note(self, pattern, step, t_us):
+        note = pattern.notes[step]
+        if note == REST:
+            return
+        key = TRACK_KEY_BASE + step
+        gate_us = (self.clock.interval_us * pattern.gates[step]) >> GATE_SHIFT
+        self.synth.note_on_at(note, t_us, key, pattern.velocity[step])
+        self.synth.note_off_at(time.ticks_add(t_us, gate_us), key)
+        self.track_sent = True
+
+    def stop_track(self):
+        # DROPS THE NOTE QUEUED FOR THE NEXT STEP AND RELEASES THE ONE SOUNDING
+        self.track_pattern = None
+        if self.track_sent:
+            self.synth.all_notes_off()
+            self.track_sent = False
+
+    def send_step_notes(self, sample_id, velocity=STEP_VELOCITY, offset=0):
+        # ONE UART WRITE PER STEP : THE LAST STEP'S NOTE OFF AND THIS STEP'S NOTE ON TOGETHER
+        out = self.midi_out
+        if self.step_note >= 0:
+            out.note_off(self.step_note, DRUM_CHANNEL)
+            self.step_note = -1
+        if sample_id != EMPTY:
+            self.step_note = max(0, min(127, DRUM_NOTE_BASE + sample_id - 1 + offset))
+            out.note_on(self.step_note, velocity, DRUM_CHANNEL)
+        out.flush()
+
+    def send_key_note_on(self, key):
+        if self.program_data.get("midi"):
+            note = KEY_NOTES[key] + 12 * self.synth.octave_shift
+            self.key_notes[key] = note
+            self.midi_out.note_on(note)
+
+    def send_key_note_off(self, key):
+        note = self.key_notes.pop(key, -1)
+        if note >= 0:
+            self.midi_out.note_off(note)
+
+    def start_midi_clock(self):
+        self.midi_clock.set_bpm(self.bpm)
+        self.midi_clock.song_position(0)
+        self.midi_clock.start()
+
+    def stop_midi_clock(self):
+        self.midi_clock.stop()
+
+    def start_sync_pulse(self):
+        # PULSE EDGES FOLLOW THE STEP CLOCK : 1 OR 2 PULSES PER STEP
+        self.sync.start(self.clock.interval_us, self.program_data.get("sync_pulses", 1))
+
+    def stop_sync_pulse(self):
+        self.sync.stop()
+
+    def shutdown(self):
+        # MODE EXIT : INPUTS PARKED, SYNTH NOTES RELEASED (THE SHARED ENGINE'S WORKER KEEPS RUNNING)
+        self.midi_in.disable()
+        if self.sync_in is not None:
+            self.sync_in.disable()
+        self.synth.all_notes_off()
 
     def stop_sequence(self):
         self.running = False
+        if self.midi_clock.running:
+            self.stop_midi_clock()
+        elif self.sync.active:
+            self.stop_sync_pulse()
+        self.ratchet_left = 0
+        self.send_step_notes(EMPTY)
+        self.stop_track()
+        store.allow_flush(True)
         self.blink_state = True
         self.last_blink_time = time.ticks_ms()
-
-        if self.last_drawn_step is not None:
-            row, col = self.map_step_to_row_col(self.last_drawn_step)
-            if self.sequence[self.last_drawn_step] is None:
-                if row == 0:
-                    self.display.set_top(col, 0)
-                else:
-                    self.display.set_bottom(col, 0)
-
         self.update_display()
 
-    def map_step_to_row_col(self, step):
-        if step < 8:
-            return 0, step
-        else:
-            return 1, step - 8
-
     def clear_step(self):
-        self.program_data["sequence"][self.current_step] = None
-        save_program(self.program_data)
+        self.pattern.clear_step(self.current_step)
+        self.store_pattern()
         self.update_display()
 
     def clear_entire_pattern(self):
-        self.program_data["sequence"] = [None] * 16
-        save_program(self.program_data)
-        self.sequence = self.program_data["sequence"]
+        self.pattern.clear()
+        self.store_pattern()
         self.display.scroll("CLEAR")
         self.update_display()
 
-    async def handle_dual_mode_inputs(self):
+    def press_synth_key(self, key):
+        if key in KEY_NOTES and key not in self.held_keys:
+            self.held_keys.append(key)
+            self.synth.note_on(KEY_NOTES[key], key)
+            self.send_key_note_on(key)
+            self.midi_out.flush()
+
+    def release_synth_keys(self):
+        # RELEASE EVERY HELD KEY THAT IS NO LONGER PRESSED (CHORDS RELEASE NOTE BY NOTE)
+        for i in range(len(self.held_keys) - 1, -1, -1):
+            key = self.held_keys[i]
+            if not self.keypad.is_pressed(key):
+                self.synth.note_off(key)
+                self.send_key_note_off(key)
+                self.held_keys.pop(i)
+        self.midi_out.flush()
+
+    async def handle_dual_mode_inputs(self, key=None):
         if not self.running and self.dual_mode:
-            key = self.keypad.get_key()
-
-            # KEY PRESSED != HELD KEY
-            if key in self.note_map:
-                if key != self.current_key:
-                    self.synth.stop_note()
-                    self.current_key = key
-                    self.synth.start_note(self.note_map[key])
-
-            elif self.current_key:
-                # CHECK FOR RELEASE OF HELD KEY
-                if not self.keypad.is_pressed(self.current_key):
-                    self.synth.stop_note()
-                    self.current_key = None
+            if key is None:
+                key = self.keypad.get_key()
 
-            # IF HELD KEY & NO NOTE RUNNING, LAUNCH
-            if self.current_key and not self.synth.running:
-                self.synth.start_note(self.note_map[self.current_key])
+            # NEW KEY : ADD A VOICE, HELD KEYS KEEP SOUNDING
+            self.press_synth_key(key)
+            self.release_synth_keys()
 
             # KY040 INPUT
             direction = self.encoder.get_direction()
-            if direction and time.ticks_diff(time.ticks_ms(), self.last_encoder_check) > 100:
+            if direction:
                 self.synth.update_control(direction)
-                self.last_encoder_check = time.ticks_ms()
\ No newline at end of file
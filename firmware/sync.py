@@ -0,0 +1,123 @@
+from machine import Pin, Timer
+from micropython import const
+import time
+from midi import MIDI_CLOCK
+from ringbuf import RingBuffer
+
+SYNC_PULSE_US = const(5000)  # VOLCA / POCKET OPERATOR STYLE 5 MS PULSE
+SYNC_IN_PIN = const(26)  # GP26 : CLOCK IN JACK (RISING EDGE, 3.3 V MAX)
+SYNC_IN_SLOTS = const(16)
+
+class SyncOut:
+    # THE TRS JACK IS SHARED WITH MIDI TX (GP20) : SYNC BORROWS THE PIN WHILE RUNNING
+    # AND HANDS IT BACK TO THE UART ON STOP, SO THE TWO CAN NEVER DRIVE IT AT ONCE
+    def __init__(self, pin_id=20, uart=None, baudrate=31250, pulse_us=SYNC_PULSE_US, pulses_per_step=1, rx_pin_id=None):
+        self.pin_id = pin_id
+        self.rx_pin_id = rx_pin_id
+        self.uart = uart
+        self.baudrate = baudrate
+        self.pin = None
+        self.timer = Timer(-1)  # FALLING EDGES + SECOND PULSE
+        self.step_timer = Timer(-1)  # RISING EDGE OF EACH STEP, ARMED A STEP AHEAD
+        self.armed = False
+        self.active = False
+        self.pulse_us = pulse_us
+        self.pulses_per_step = pulses_per_step
+        self.gap_us = 0
+        self.pending = 0
+        self.pulses = 0
+        self._rise_cb = self._rise
+        self._fall_cb = self._fall
+        self._step_cb = self._step_rise
+
+    def acquire(self):
+        self.pin = Pin(self.pin_id, Pin.OUT, value=0)
+
+    def release(self):
+        if self.pin is not None:
+            self.pin.value(0)
+            self.pin = None
+        if self.uart is None:
+            return
+        if self.rx_pin_id is None:
+            self.uart.init(baudrate=self.baudrate, tx=Pin(self.pin_id))
+        else:
+            self.uart.init(baudrate=self.baudrate, tx=Pin(self.pin_id), rx=Pin(self.rx_pin_id))
+
+    def start(self, step_us, pulses_per_step=None):
+        if pulses_per_step is not None:
+            self.pulses_per_step = max(1, min(2, pulses_per_step))
+        # SECOND PULSE (IF ANY) LANDS EXACTLY HALF A STEP AFTER THE FIRST RISING EDGE
+        self.gap_us = step_us // self.pulses_per_step - self.pulse_us
+        self.pulses = 0
+        self.armed = False
+        self.acquire()
+        self.active = True
+
+    def stop(self):
+        self.active = False
+        self.armed = False
+        self.step_timer.deinit()
+        self.timer.deinit()
+        self.release()
+
+    def _arm(self, delay_us, callback):
+        self.timer.init(mode=Timer.ONE_SHOT, period=delay_us, tick_hz=1_000_000, callback=callback, hard=True)
+
+    def step(self, next_us=None):
+        # CALLED AS THE STEP CLOCK FIRES : THIS STEP'S RISING EDGE WAS ARMED A STEP AGO (ONLY THE FIRST
+        # STEP RISES HERE), THEN THE NEXT STEP'S EDGE IS ARMED FOR ITS DEADLINE : NO EDGE FROM THE LOOP
+        if not self.active:
+            return
+        if not self.armed:
+            self._step_rise(None)
+        self.armed = next_us is not None
+        if self.armed:
+            delay = max(1, time.ticks_diff(next_us, time.ticks_us()))
+            self.step_timer.init(mode=Timer.ONE_SHOT, period=delay, tick_hz=1_000_000, callback=self._step_cb, hard=True)
+
+    def _step_rise(self, _):
+        if self.active:
+            self.pending = self.pulses_per_step - 1
+            self.pin.value(1)
+            self.pulses += 1
+            self._arm(self.pulse_us, self._fall_cb)
+
+    def _rise(self, _):
+        if self.active:
+            self.pin.value(1)
+            self.pulses += 1
+            self._arm(self.pulse_us, self._fall_cb)
+
+    def _fall(self, _):
+        if self.pin is not None:
+            self.pin.value(0)
+        if self.active and self.pending > 0:
+            self.pending -= 1
+            self._arm(self.gap_us, self._rise_cb)
+
+# SYNC IN : RISING EDGES ARE TIMESTAMPED IN A HARD IRQ AND REPLAYED AS MIDI CLOCK TICKS
+class SyncIn:
+    def __init__(self, pin_id=SYNC_IN_PIN):
+        self.pin = Pin(pin_id, Pin.IN)
+        self.events = RingBuffer(SYNC_IN_SLOTS, 'i')
+        self.clock = None
+        self._edge_cb = self._edge
+        self.enable()
+
+    def enable(self):
+        self.pin.irq(handler=self._edge_cb, trigger=Pin.IRQ_RISING, hard=True)
+
+    def disable(self):
+        self.pin.irq(handler=None)
+
+    def _edge(self, _):
+        self.events.put(time.ticks_us())
+
+    def poll(self):
+        while True:
+            t_us = self.events.get()
+            if t_us < 0:
+                return
+            if self.clock is not None:
+                self.clock.feed(MIDI_CLOCK, t_us)
@@ -1,31 +1,153 @@
-from machine import PWM, Pin
+from micropython import const
+from array import array
 import math
+import micropython
+from audio_out import AudioOutput
+import wavetables
 from program_io import save_program
+from ringbuf import RingBuffer
 import _thread
-import micropython
 import time
 
+# FIXED-POINT DDS : 8.16 PHASE ACCUMULATOR, TABLE INDEX FROM THE TOP 8 BITS
+# (24 BITS KEEPS EVERY INTERMEDIATE A SMALL INT, NO HEAP ALLOCATION PER SAMPLE)
+PHASE_BITS = const(24)
+PHASE_MASK = const(0xFFFFFF)
+INDEX_SHIFT = const(16)
+
+# AMPLITUDE SCALING : Q8 GAIN, INTEGER MULTIPLY + SHIFT
+GAIN_SHIFT = const(8)
+GAIN_ONE = const(256)
+ENV_ONE = const(65536)
+
+# BLOCK LEVEL : Q14, SO A FULL-SCALE SAMPLE TIMES THE LEVEL STAYS A SMALL INT
+LEVEL_SHIFT = const(14)
+LEVEL_ONE = const(16384)
+
+# SAMPLES PER BLOCK : MODULATION IS EVALUATED ONCE PER BLOCK AND RAMPED ACROSS IT
+RENDER_BLOCK = const(64)
+
+# VOICE POOL : MIX HEADROOM OF 2/VOICES, SO EVERY VOICE AT FULL VOLUME (0.5) CANNOT CLIP
+VOICES = const(4)
+MIX_SCALE = const(128)  # Q8 : 256 * 2 // VOICES
+RELEASE_SAMPLES = const(400)  # ~20 MS FADE-OUT ON NOTE OFF / STEAL
+
+# AUDIO WORKER (CORE 1) : RENDER WHEN LESS THAN ONE BLOCK IS QUEUED, SO A NOTE SOUNDS WITHIN ONE BLOCK
+COMMAND_SLOTS = const(32)
+WORKER_POLL_US = const(800)
+SHUTDOWN_TIMEOUT_MS = const(500)
+
+# TIMED EVENTS : HELD BY THE WORKER UNTIL THEIR TIMESTAMP REACHES THE AUDIO BEING RENDERED
+SCHEDULE_SLOTS = const(16)
+
+# COMMANDS : UI CORE -> AUDIO WORKER, RECORDS OF (COMMAND, ARG, VALUE, TIME)
+CMD_NOTE_ON = const(1)  # ARG : KEY ID, VALUE : MIDI NOTE | VELOCITY << 8
+CMD_NOTE_OFF = const(2)  # ARG : KEY ID
+CMD_ALL_OFF = const(3)
+CMD_WAVEFORM = const(4)  # ARG : INDEX INTO wavetables.WAVEFORMS
+CMD_CONTROL = const(5)  # ARG : CONTROL MODE CODE, VALUE : CONTROL VALUE
+CMD_STOP = const(6)
+CMD_NOTE_ON_AT = const(7)  # AS CMD_NOTE_ON, TIME : time.ticks_us() AT WHICH THE NOTE IS HEARD
+CMD_NOTE_OFF_AT = const(8)  # AS CMD_NOTE_OFF, TIME : time.ticks_us() AT WHICH THE RELEASE STARTS
+
+# CONTROL MODE CODES
+MODE_DISABLED = const(0)
+MODE_CUTOFF = const(1)
+MODE_ASDR = const(2)
+MODE_ASDR_WAVE = const(3)
+MODE_FILTER_SWEEP = const(4)
+MODE_FILTER_MOD = const(5)
+MODE_PITCH_BEND = const(6)
+
+# KEYPAD -> MIDI NOTE, IN KEYPAD ORDER : C4 D4 E4 F4 / G4 A4 B4 C5 / C#5 D5 D#5 E5 / F5 F#5 G5 G#5
+KEY_NOTES = {
+    '1': 60, '2': 62, '3': 64, 'A': 65,
+    '5': 67, '6': 69, '7': 71, 'B': 72,
+    '9': 73, '10': 74, '11': 75, 'C': 76,
+    '13': 77, '14': 78, '15': 79, 'D': 80
+}
+
+CONTROL_CODES = {
+    "DISABLED": MODE_DISABLED,
+    "CUTOFF": MODE_CUTOFF,
+    "ASDR": MODE_ASDR,
+    "ASDR_WAVE": MODE_ASDR_WAVE,
+    "FILTER SWEEP": MODE_FILTER_SWEEP,
+    "FILTER MOD": MODE_FILTER_MOD,
+    "PITCH BEND": MODE_PITCH_BEND,
+}
+
+class Voice:
+    __slots__ = ("active", "releasing", "key", "age", "note", "velocity", "base_inc", "mod_depth",
+                 "table", "shaped", "render_table", "acc", "inc", "gain",
+                 "env", "env_acc", "lfo_acc", "release")
+
+    def __init__(self, table_size):
+        self.active = False
+        self.releasing = False
+        self.key = None
+        self.age = 0
+        self.note = 0
+        self.velocity = GAIN_ONE
+        self.base_inc = 0
+        self.mod_depth = 0
+        self.table = None
+        self.shaped = array('H', [0] * table_size)
+        self.render_table = None
+        self.acc = 0
+        self.inc = 0
+        self.gain = 0
+        self.env = 0
+        self.env_acc = 0
+        self.lfo_acc = 0
+        self.release = ENV_ONE
+
 class Synthesizer:
     def __init__(self, pwm_pin=15, program_data=None, sample_rate=20000):
-        self.program_data = program_data
         self.sample_rate = sample_rate
-        self.pwm = PWM(Pin(pwm_pin))
-        self.pwm.freq(sample_rate)
-        self.freq = 440
-        self.running = False
-        self.thread_lock = False
-        self.phase_acc = 0
-        self.phase_inc = 0
-        self.table_size = 256
-        self.octave_shift = 0
+        self.output = AudioOutput(pwm_pin=pwm_pin, sample_rate=sample_rate)
+        self.block = array('H', [0] * RENDER_BLOCK)
+        self.mix = array('i', [0] * RENDER_BLOCK)
+        self.table_size = wavetables.TABLE_SIZE
         self.volume = 0.5
+        self.note_count = 0
+        self._load_program(program_data)
+
+        # ENGINE STATE : OWNED BY THE AUDIO WORKER, CHANGED ONLY THROUGH COMMANDS
+        self.wave = wavetables.resolve(self.waveform)
+        self.mode = CONTROL_CODES.get(self.control, MODE_DISABLED)
+        self.value = self.control_value
+        self.sine_table = wavetables.SINE
 
+        # MIDI NOTE -> PHASE INCREMENT, COMPUTED ONCE : NO FLOAT PITCH MATH ON NOTE ON
+        self.note_inc = array('i', [int(440 * 2 ** ((note - 69) / 12) * (1 << PHASE_BITS) / sample_rate) for note in range(128)])
+        self.voices = [Voice(self.table_size) for _ in range(VOICES)]
+        self._update_params()
+
+        self.commands = RingBuffer(COMMAND_SLOTS, 'i', 4)
+        self.message = [0, 0, 0, 0]
+
+        # SCHEDULE : FIXED SLOTS OWNED BY THE WORKER, COMMAND 0 = FREE
+        self.sched_command = bytearray(SCHEDULE_SLOTS)
+        self.sched_key = array('i', [0] * SCHEDULE_SLOTS)
+        self.sched_value = array('i', [0] * SCHEDULE_SLOTS)
+        self.sched_time = array('i', [0] * SCHEDULE_SLOTS)
+        self.scheduled = 0
+        self.schedule_full = 0
+        self.us_per_sample = 1_000_000 // sample_rate
+        self.key_ids = {}
+        self.commands_processed = 0
+        self.worker_running = False
+        self.worker_alive = False
+
+    def _load_program(self, program_data):
+        self.program_data = program_data
         if program_data:
             self.waveform = program_data.get("waveform", "SIN")
             self.control = program_data.get("control", "DISABLED")
             self.control_value = program_data.get("control_value", 0)
             self.octave_shift = program_data.get("octave_shift", 0)
-            
+
             # WRITE MISSING KEYS TO DEFAULT
             if "waveform" not in program_data:
                 program_data["waveform"] = self.waveform
@@ -37,41 +159,31 @@ class Synthesizer:
             self.waveform = "SIN"
             self.control = "DISABLED"
             self.control_value = 0
+            self.octave_shift = 0
 
-        self.current_table = self.generate_table(self.waveform)
-
-    def _noop(self, _):
-        pass
-
-    def generate_table(self, waveform_type):
-        table = []
-        for i in range(self.table_size):
-            phase = 2 * math.pi * i / self.table_size
-
-            if waveform_type == "SIN":
-                value = (math.sin(phase) + 1) / 2
-                weight = 1.0  # No harmonic reduction needed
-            elif waveform_type == "SQUARE":
-                value = 1.0 if i < self.table_size / 2 else 0.0
-                weight = (1 - (i / self.table_size)) ** 2
-            elif waveform_type == "TRIANGLE":
-                value = 2 * abs(2 * (i / self.table_size) - 1)
-                weight = 1.0  # Already smooth
-            elif waveform_type == "SAWTOOTH":
-                value = i / self.table_size
-                weight = (1 - (i / self.table_size)) ** 2
-            else:
-                value = (math.sin(phase) + 1) / 2
-                weight = 1.0
-
-            table.append(int(value * 65535 * weight))
-        return table
+    def set_program(self, program_data):
+        # RE-POINT THE LONG-LIVED ENGINE : NO PWM / TABLE REBUILD
+        self._load_program(program_data)
+        if self.worker_alive:
+            # CORE 1 OWNS THE ENGINE STATE : HAND THE CHANGE OVER AS COMMANDS
+            self.commands.put(CMD_ALL_OFF)
+            self._send_waveform()
+            self._send_control()
+            return
+        # NO CONSUMER : ANYTHING LEFT IN THE RING BELONGS TO THE OLD PROGRAM
+        self.commands.clear()
+        self.wave = wavetables.resolve(self.waveform)
+        self.mode = CONTROL_CODES.get(self.control, MODE_DISABLED)
+        self.value = self.control_value
+        for voice in self.voices:
+            voice.active = False
+        self._update_params()
 
     def set_waveform(self, waveform_type):
         self.waveform = waveform_type
-        self.current_table = self.generate_table(waveform_type)
         if self.program_data:
             self.program_data["waveform"] = waveform_type
+        self._send_waveform()
 
     def set_control_target(self, target):
         self.control = target
@@ -79,11 +191,31 @@ class Synthesizer:
             self.program_data["control"] = target
         if target == "DISABLED":
             self.control_value = 0
+        self._send_control()
 
     def update_control(self, delta):
         self.control_value = max(1, min(100, self.control_value + delta))
         if self.program_data:
             self.program_data["control_value"] = self.control_value
+        self._send_control()
+
+    # WITH THE WORKER RUNNING, CORE 1 OWNS THE ENGINE STATE AND CHANGES GO THROUGH THE RING;
+    # WITHOUT IT CORE 0 WRITES THE STATE ITSELF (ENCODER TURNS BEFORE THE FIRST NOTE NEVER FILL THE RING)
+
+    def _send_waveform(self):
+        if self.worker_alive:
+            self.commands.put(CMD_WAVEFORM, wavetables.WAVEFORMS.index(wavetables.resolve(self.waveform)))
+            return
+        self.wave = wavetables.resolve(self.waveform)
+        self._update_params()
+
+    def _send_control(self):
+        if self.worker_alive:
+            self.commands.put(CMD_CONTROL, CONTROL_CODES.get(self.control, MODE_DISABLED), self.control_value)
+            return
+        self.mode = CONTROL_CODES.get(self.control, MODE_DISABLED)
+        self.value = self.control_value
+        self._update_params()
 
     def octave_up(self):
         if self.octave_shift < 3:
@@ -99,90 +231,378 @@ class Synthesizer:
                 self.program_data["octave_shift"] = self.octave_shift
                 save_program(self.program_data)
 
-    def start_note(self, freq):
+    def _update_params(self):
+        # SHARED BY ALL VOICES : RECOMPUTED ON CONTROL CHANGES ONLY, NEVER PER SAMPLE
+        value = self.value
+        self.level = int(self.volume * LEVEL_ONE) * MIX_SCALE >> GAIN_SHIFT
+        self.release_step = ENV_ONE // RELEASE_SAMPLES
+
+        # PITCH BEND : STATIC +/- 2 SEMITONES FOLDED INTO EACH VOICE'S INCREMENT
+        self.bend_factor = 1.0
+        if self.mode == MODE_PITCH_BEND:
+            bend = (value / 32767.0 - 0.5) * 2 * 2
+            self.bend_factor = 2 ** (bend / 12.0)
+
+        # ASDR : ATTACK LENGTH IN SAMPLES
+        attack = max(1, int(value / 4))
+        self.env_step = max(1, ENV_ONE // attack)
+
+        # ASDR_WAVE : 0.5 HZ |SIN| ENVELOPE SCALED BY CONTROL VALUE
+        self.env_inc = int(0.5 * (1 << PHASE_BITS) / self.sample_rate)
+        self.wave_level = min(GAIN_ONE, value * GAIN_ONE // 65535)
+
+        # FILTER MOD : ~3.2 HZ VIBRATO, UP TO +/- 10% OF THE BASE INCREMENT
+        self.lfo_inc = int((20.0 / (2 * math.pi)) * (1 << PHASE_BITS) / self.sample_rate)
+
+        for voice in self.voices:
+            if voice.active:
+                self._update_voice(voice)
+
+    def _update_voice(self, voice):
+        # PER-VOICE : PHASE INCREMENT, BAND-LIMITED TABLE AND SHAPED TABLE
+        value = self.value
+        note_inc = self.note_inc[voice.note]
+        inc = note_inc if self.bend_factor == 1.0 else int(note_inc * self.bend_factor)
+        voice.base_inc = inc
+        voice.mod_depth = int(inc * min(value, 32767) / 327670)
+
+        # BAND-LIMITED TABLE FOR THE OCTAVE THIS NOTE FALLS IN (NO PER-SAMPLE FILTERING)
+        voice.table = wavetables.get_table(self.wave, inc * wavetables.SAMPLE_RATE / (1 << PHASE_BITS))
+
+        # CUTOFF / FILTER SWEEP ONLY DEPEND ON THE TABLE INDEX : BAKE THEM INTO A SHAPED TABLE
+        voice.render_table = voice.table
+        if self.mode == MODE_CUTOFF:
+            self._shape_cutoff(voice, int(note_inc / (1 << PHASE_BITS) * value * self.table_size))
+        elif self.mode == MODE_FILTER_SWEEP:
+            self._shape_sweep(voice, min(GAIN_ONE * 16, value * GAIN_ONE // 100))
+
+    def _shape_cutoff(self, voice, cutoff_index):
+        table = voice.table
+        shaped = voice.shaped
+        for i in range(self.table_size):
+            sample = table[i]
+            if i > cutoff_index:
+                sample = (sample * 205) >> GAIN_SHIFT  # 80% beyond cutoff
+            shaped[i] = sample
+        voice.render_table = shaped
+
+    def _shape_sweep(self, voice, sweep_gain):
+        # ONE SWEEP CYCLE PER WAVEFORM CYCLE, SO THE SWEEP SHARES THE OSCILLATOR PHASE
+        table = voice.table
+        sine = self.sine_table
+        shaped = voice.shaped
+        for i in range(self.table_size):
+            sample = (table[i] * ((sine[i] * sweep_gain) >> 16)) >> GAIN_SHIFT
+            shaped[i] = sample if sample < 65535 else 65535
+        voice.render_table = shaped
+
+# VOICE ALLOCATION
+
+    def _allocate(self):
+        # FREE VOICE FIRST, THEN STEAL THE QUIETEST RELEASING VOICE, THEN THE OLDEST HELD ONE
+        quietest = None
+        oldest = None
+        for voice in self.voices:
+            if not voice.active:
+                return voice
+            if voice.releasing:
+                if quietest is None or voice.gain < quietest.gain:
+                    quietest = voice
+            elif oldest is None or voice.age < oldest.age:
+                oldest = voice
+        return quietest if quietest is not None else oldest
+
+    def _key_id(self, key):
+        # KEYS ARE SENT AS SMALL INTS : INTS PASS THROUGH, ANY OTHER HASHABLE KEY GETS A STABLE ID ON FIRST USE
+        if key is None:
+            return 0
+        if isinstance(key, int):
+            return key
+        key_id = self.key_ids.get(key)
+        if key_id is None:
+            key_id = len(self.key_ids) + 1
+            self.key_ids[key] = key_id
+        return key_id
+
+    def note_on(self, note, key=None, velocity=127):
+        note = max(0, min(127, note + 12 * self.octave_shift))
+        self.commands.put(CMD_NOTE_ON, self._key_id(key), note | (velocity << 8))
+        if not self.worker_running:
+            self.start()
+
+    def note_off(self, key=None):
+        self.commands.put(CMD_NOTE_OFF, self._key_id(key))
+
+    def note_on_at(self, note, t_us, key=None, velocity=127):
+        # SEQUENCED NOTES : SENT AHEAD, STARTED BY THE WORKER ON THE SAMPLE THAT PLAYS AT t_us
+        note = max(0, min(127, note + 12 * self.octave_shift))
+        self.commands.put(CMD_NOTE_ON_AT, self._key_id(key), note | (velocity << 8), t_us)
+        if not self.worker_running:
+            self.start()
+
+    def note_off_at(self, t_us, key=None):
+        self.commands.put(CMD_NOTE_OFF_AT, self._key_id(key), 0, t_us)
+
+    def all_notes_off(self):
+        self.commands.put(CMD_ALL_OFF)
+
+    def start_note(self, note):
+        self.note_on(note)
+
+    def stop_note(self):
+        self.all_notes_off()
+
+    def commands_dropped(self):
+        return self.commands.dropped
+
+# AUDIO WORKER (CORE 1)
+
+    def start(self):
+        # ONE LONG-LIVED THREAD ON THE SECOND CORE, STARTED ONCE
+        if self.worker_running:
+            return
+        # ALIVE FROM HERE : A shutdown() BEFORE THE THREAD RUNS STILL WAITS FOR IT TO TAKE ITS STOP
+        self.worker_running = True
+        self.worker_alive = True
         try:
-            if not self.thread_lock and not self.running:
-                self.freq = freq * (2 ** self.octave_shift)
-                self.running = True
-                _thread.start_new_thread(self._play_note, ())
-                time.sleep_ms(1)
+            _thread.start_new_thread(self._worker, ())
         except Exception as e:
-            print("Synth thread launch failed:", e)
-
-    def _play_note(self):
-        self.thread_lock = True
-        start_time = time.ticks_ms()
-        envelope_phase = 0
-        filter_phase = 0
-        bend_phase = 0
-        bend_max = 200
-        sweep_max = 200
-        attack = max(1, int(self.control_value / 4))
-
-        while self.running:
-            micropython.schedule(self._noop, 0)
-            self.phase_inc = self.freq * self.table_size / self.sample_rate
-            self.phase_acc = (self.phase_acc + self.phase_inc) % self.table_size
-            index = int(self.phase_acc) % self.table_size
-            sample = self.current_table[index]
-
-            # HARMONIC WEIGHT
-            # weight = (1 - (index / self.table_size)) ** 2
-            # sample = int(sample * weight)
-
-# CONTROL MODES
-            
-            # CUTOFF ENVELOPE
-            if self.control == "CUTOFF":
-                cutoff_index = int((self.freq / self.sample_rate) * self.control_value * self.table_size)
-                smooth_factor = 0.8  # 80% reduction beyond cutoff
-                if index > cutoff_index:
-                    sample = int(sample * smooth_factor)
-
-            # ASDR : ATTACK FADE-IN
-            if self.control == "ASDR":
-                amp = min(1.0, envelope_phase / attack)
-                sample = int(sample * amp)
-                
-            #ASDR : WAVEFORM
-            elif self.control == "ASDR_WAVE":
-                cycle = (envelope_phase / self.sample_rate)
-                envelope = min(1.0, (1 - abs(math.sin(cycle * math.pi))) * (self.control_value / 65535))
-                sample = int(sample * envelope)
-        
-            # FILTER SWEEP
-            elif self.control == "FILTER SWEEP":
-                sweep_max = max(1, int(self.sample_rate / self.freq))  # one sweep cycle per waveform cycle
-                sweep_ratio = (math.sin(2 * math.pi * (filter_phase / sweep_max)) + 1) / 2
-                mod = int(self.control_value * sweep_ratio)
-                sample = int(sample * (mod / 100.0))
-                filter_phase = (filter_phase + 1) % sweep_max
-
-            # FILTER MOD
-            if self.control == "FILTER MOD":
-                mod = math.sin(time.ticks_ms() / 50.0)
-                depth = self.control_value / 32767.0
-                freq_mod = self.freq * (1.0 + depth * mod * 0.1)
-                self.phase_inc = int((freq_mod * self.table_size) / self.sample_rate * (1 << 16))
-
-            # PITCH BEND
-            if self.control == "PITCH BEND":
-                semitone_range = 2
-                bend = (self.control_value / 32767.0 - 0.5) * 2 * semitone_range
-                bend_factor = 2 ** (bend / 12.0)
-                self.phase_inc = int((self.freq * bend_factor * self.table_size) / self.sample_rate * (1 << 16))
-
-            sample = int(sample * self.volume)
-            sample = max(0, min(65535, sample))
-            self.pwm.duty_u16(sample)
-            time.sleep_us(int(1_000_000 / self.sample_rate))
-
-        self.running = False
-        self.thread_lock = False
-        self.pwm.duty_u16(0)
+            self.worker_running = False
+            self.worker_alive = False
+            print("Synth worker launch failed:", e)
 
-    def stop_note(self):
-        self.running = False
-        while self.thread_lock:
+    def shutdown(self):
+        # RELEASES CORE 1 FOR THE NEXT ENGINE : STOP GOES THROUGH THE RING AFTER PENDING COMMANDS,
+        # RETRIED WHILE THE RING IS FULL, WITH A BOUNDED WAIT
+        if not self.worker_running and not self.worker_alive:
+            self.commands.clear()
+            return
+        start = time.ticks_ms()
+        while not self.commands.put(CMD_STOP):
+            if time.ticks_diff(time.ticks_ms(), start) > SHUTDOWN_TIMEOUT_MS:
+                break
             time.sleep_ms(1)
-        self.pwm.duty_u16(0)
\ No newline at end of file
+        while self.worker_alive:
+            if time.ticks_diff(time.ticks_ms(), start) > SHUTDOWN_TIMEOUT_MS:
+                # WORKER NOT DRAINING THE RING : STOP IT THROUGH THE FLAG IT POLLS
+                self.worker_running = False
+                if time.ticks_diff(time.ticks_ms(), start) > 2 * SHUTDOWN_TIMEOUT_MS:
+                    print("Synth worker did not stop")
+                    return
+            time.sleep_ms(1)
+        # NO STALE STOP (OR NOTES) LEFT FOR THE NEXT SESSION'S WORKER : SAFE, THE CONSUMER IS GONE
+        self.worker_running = False
+        self.commands.clear()
+
+    def _note_on(self, key_id, note, velocity):
+        voice = self._allocate()
+        if not voice.active:
+            voice.acc = 0
+            voice.gain = 0  # RAMP IN FROM SILENCE OVER THE FIRST BLOCK
+        self.note_count += 1
+        voice.age = self.note_count
+        voice.key = key_id
+        voice.note = note
+        voice.velocity = velocity * GAIN_ONE // 127
+        voice.env = 0
+        voice.env_acc = 0
+        voice.lfo_acc = 0
+        voice.release = ENV_ONE
+        voice.releasing = False
+        self._update_voice(voice)
+        voice.inc = voice.base_inc
+        voice.active = True
+
+    def _note_off(self, key_id):
+        for voice in self.voices:
+            if voice.active and voice.key == key_id:
+                voice.releasing = True
+
+    def _schedule(self, command, key_id, value, t_us):
+        sched_command = self.sched_command
+        for slot in range(SCHEDULE_SLOTS):
+            if not sched_command[slot]:
+                sched_command[slot] = command
+                self.sched_key[slot] = key_id
+                self.sched_value[slot] = value
+                self.sched_time[slot] = t_us
+                self.scheduled += 1
+                return
+        # TABLE FULL : PLAY IT NOW RATHER THAN LOSE A NOTE OFF
+        self.schedule_full += 1
+        self._fire(command, key_id, value)
+
+    def _fire(self, command, key_id, value):
+        if command == CMD_NOTE_ON_AT:
+            self._note_on(key_id, value & 0x7F, value >> 8)
+        else:
+            self._note_off(key_id)
+
+    def run_schedule(self):
+        # DUE = FALLS INSIDE THE AUDIO ALREADY QUEUED : A BLOCK RENDERED NOW IS HEARD AFTER THE BUFFER DRAINS
+        if not self.scheduled:
+            return
+        horizon = time.ticks_add(time.ticks_us(), self.output.available() * self.us_per_sample)
+        sched_command = self.sched_command
+        sched_time = self.sched_time
+        for slot in range(SCHEDULE_SLOTS):
+            command = sched_command[slot]
+            if command and time.ticks_diff(horizon, sched_time[slot]) >= 0:
+                sched_command[slot] = 0
+                self.scheduled -= 1
+                self._fire(command, self.sched_key[slot], self.sched_value[slot])
+
+    def clear_schedule(self):
+        sched_command = self.sched_command
+        for slot in range(SCHEDULE_SLOTS):
+            sched_command[slot] = 0
+        self.scheduled = 0
+
+    def process_commands(self):
+        commands = self.commands
+        message = self.message
+        while commands.get_into(message):
+            command = message[0]
+            if command == CMD_NOTE_ON:
+                self._note_on(message[1], message[2] & 0x7F, message[2] >> 8)
+            elif command == CMD_NOTE_OFF:
+                self._note_off(message[1])
+            elif command == CMD_NOTE_ON_AT or command == CMD_NOTE_OFF_AT:
+                self._schedule(command, message[1], message[2], message[3])
+            elif command == CMD_ALL_OFF:
+                # PENDING SEQUENCED NOTES GO TOO : NOTHING STARTS AFTER AN ALL-OFF
+                self.clear_schedule()
+                for voice in self.voices:
+                    voice.releasing = True
+            elif command == CMD_WAVEFORM:
+                self.wave = wavetables.WAVEFORMS[message[1]]
+                self._update_params()
+            elif command == CMD_CONTROL:
+                self.mode = message[1]
+                self.value = message[2]
+                self._update_params()
+            elif command == CMD_STOP:
+                self.worker_running = False
+            self.commands_processed += 1
+
+    def _worker(self):
+        self.worker_alive = True
+        output = self.output
+        block = self.block
+
+        while self.worker_running:
+            # COMMANDS FIRST : A NOTE-ON LANDS IN THE VERY NEXT BLOCK
+            self.process_commands()
+            self.run_schedule()
+
+            if self.active_voices():
+                if output.available() < RENDER_BLOCK:
+                    self.render_block(block, RENDER_BLOCK)
+                    output.write(block, RENDER_BLOCK)
+                    output.start()
+                    continue
+            elif output.running and output.available() < RENDER_BLOCK:
+                # IDLE : LET THE RELEASE TAIL DRAIN, THEN STOP THE TIMER IRQ
+                output.stop()
+
+            time.sleep_us(WORKER_POLL_US)
+
+        output.stop()
+        self.clear_schedule()
+        self.worker_alive = False
+
+# RENDERING
+
+    @micropython.native
+    def _render_voice(self, voice, mix, n):
+
+# CONTROL MODES : EVALUATED ONCE PER BLOCK (CONTROL RATE)
+
+        mode = self.mode
+        level = (self.level * voice.velocity) >> GAIN_SHIFT
+        inc = voice.base_inc
+
+        # ASDR : ATTACK FADE-IN
+        if mode == MODE_ASDR:
+            env = voice.env + self.env_step * n
+            if env > ENV_ONE:
+                env = ENV_ONE
+            voice.env = env
+            level = (level * (env >> 2)) >> LEVEL_SHIFT
+
+        # ASDR : WAVEFORM
+        elif mode == MODE_ASDR_WAVE:
+            voice.env_acc = (voice.env_acc + self.env_inc * n) & PHASE_MASK
+            shape = 32768 - abs(self.sine_table[voice.env_acc >> INDEX_SHIFT] - 32768)
+            level = (level * ((shape * self.wave_level) >> 15)) >> GAIN_SHIFT
+
+        # FILTER MOD
+        elif mode == MODE_FILTER_MOD:
+            voice.lfo_acc = (voice.lfo_acc + self.lfo_inc * n) & PHASE_MASK
+            inc += (voice.mod_depth * ((self.sine_table[voice.lfo_acc >> INDEX_SHIFT] >> 8) - 128)) >> 7
+
+        # CUTOFF / FILTER SWEEP : SHAPED TABLE, PITCH BEND : PHASE INCREMENT
+
+        # RELEASE : PER-VOICE FADE-OUT, THE VOICE FREES ITSELF AT ZERO
+        if voice.releasing:
+            release = voice.release - self.release_step * n
+            if release < 0:
+                release = 0
+            voice.release = release
+            level = (level * (release >> 2)) >> LEVEL_SHIFT
+
+# AUDIO RATE : LINEAR RAMP FROM THE PREVIOUS BLOCK (NO ZIPPER NOISE ON CONTROL CHANGES)
+
+        gain = voice.gain
+        step_inc = voice.inc
+        d_gain = (level - gain) // n if level >= gain else -((gain - level) // n)
+        d_inc = (inc - step_inc) // n if inc >= step_inc else -((step_inc - inc) // n)
+        voice.gain = level
+        voice.inc = inc
+
+        table = voice.render_table
+        acc = voice.acc
+        if d_gain == 0 and d_inc == 0:
+            for i in range(n):
+                acc = (acc + step_inc) & PHASE_MASK
+                mix[i] += (table[acc >> INDEX_SHIFT] * gain) >> LEVEL_SHIFT
+        else:
+            for i in range(n):
+                acc = (acc + step_inc) & PHASE_MASK
+                mix[i] += (table[acc >> INDEX_SHIFT] * gain) >> LEVEL_SHIFT
+                gain += d_gain
+                step_inc += d_inc
+        voice.acc = acc
+
+        if voice.releasing and level == 0:
+            voice.active = False
+
+    @micropython.native
+    def render_block(self, buf, n):
+        # mix HOLDS ONE RENDER_BLOCK : LONGER REQUESTS ARE RENDERED A BLOCK AT A TIME
+        mix = self.mix
+        base = 0
+        while base < n:
+            count = n - base
+            if count > RENDER_BLOCK:
+                count = RENDER_BLOCK
+            for voice in self.voices:
+                if voice.active:
+                    self._render_voice(voice, mix, count)
+
+            # INTEGER MIX, CLAMPED TO THE PWM RANGE (CLEARED HERE FOR THE NEXT BLOCK)
+            for i in range(count):
+                sample = mix[i]
+                mix[i] = 0
+                buf[base + i] = sample if sample < 65535 else 65535
+            base += count
+
+    def active_voices(self):
+        count = 0
+        for voice in self.voices:
+            if voice.active:
+                count += 1
+        return count
+
+    def underruns(self):
+        return self.output.underruns
@@ -1,12 +1,95 @@
+import uasyncio as asyncio
 from micropython import const
 from machine import Pin
-from utime import sleep_us, sleep_ms
+from utime import sleep_us
+
+try:
+    import rp2
+except ImportError:
+    rp2 = None
 
 TM1637_CMD1 = const(64)
 TM1637_CMD2 = const(192)
 TM1637_CMD3 = const(128)
 TM1637_DSP_ON = const(8)
 TM1637_DELAY = const(10)
+TM1637_DIGITS = const(4)
+
+# PIO TRANSMIT : ONE FIFO WORD PER BYTE = START FLAG | STOP FLAG << 1 | BYTE << 2
+PIO_SM = const(4)  # FIRST STATE MACHINE OF PIO1
+PIO_FREQ = const(200_000)  # 5 US PER CYCLE, 10 US PER CLOCK PHASE (SAME AS THE BIT-BANG DELAY)
+PIO_START = const(1)
+PIO_STOP = const(2)
+
+# STEP GRID : TWO STEPS PER DIGIT, EVEN STEP = LEFT SEGMENT, ODD STEP = RIGHT SEGMENT
+TOP_PAIR = b'\x00\x20\x02\x22'  # STEPS 1-8 : F / B
+BOTTOM_PAIR = b'\x00\x10\x04\x14'  # STEPS 9-16 : E / C
+
+# SEGMENT FONT : 0-9, A-Z, SPACE, DASH, STAR (DEGREE)
+SEGMENTS = b'\x3F\x06\x5B\x4F\x66\x6D\x7D\x07\x7F\x6F\x77\x7C\x39\x5E\x79\x71\x3D\x76\x06\x1E\x76\x38\x55\x54\x3F\x73\x67\x50\x6D\x78\x3E\x1C\x2A\x76\x6E\x5B\x00\x40\x63'
+
+# ANIMATION JOBS : RUN BY A BACKGROUND TASK OVER THE CALLER'S FRAME, NEVER AWAITED BY THE CALLER
+JOB_SCROLL = const(0)
+JOB_BLINK = const(1)
+JOB_FLASH = const(2)
+JOB_SLOTS = const(4)
+
+# encode_string() OUTPUT : ONE SHARED BUFFER, VALID UNTIL THE NEXT CALL (LONGER TEXT GETS ITS OWN)
+TEXT_MAX = const(32)
+_text = bytearray(TEXT_MAX)
+_text_view = memoryview(_text)
+
+if rp2 is not None:
+    @rp2.asm_pio(out_init=rp2.PIO.OUT_HIGH, set_init=rp2.PIO.OUT_HIGH, sideset_init=rp2.PIO.OUT_HIGH,
+                 out_shiftdir=rp2.PIO.SHIFT_RIGHT, fifo_join=rp2.PIO.JOIN_TX)
+    def _tm1637_tx():
+        # DIO = OUT / SET PIN, CLK = SIDE-SET
+        wrap_target()
+        label("next")
+        pull(block)             .side(0)
+        out(y, 1)               .side(0)
+        jmp(not_y, "data")      .side(0)
+        set(pins, 1)            .side(1) [1]
+        set(pins, 0)            .side(1) [1]  # START : DIO FALLS WHILE CLK IS HIGH
+        label("data")
+        out(y, 1)               .side(0)
+        set(x, 7)               .side(0)
+        label("bit")
+        out(pins, 1)            .side(0) [1]  # LSB FIRST, SAMPLED ON THE RISING EDGE
+        jmp(x_dec, "bit")       .side(1) [1]
+        set(pindirs, 0)         .side(0) [1]  # ACK : RELEASE DIO FOR THE NINTH CLOCK
+        nop()                   .side(1) [1]
+        nop()                   .side(0) [1]
+        set(pindirs, 1)         .side(0)
+        jmp(not_y, "next")      .side(0)
+        set(pins, 0)            .side(0) [1]
+        nop()                   .side(1) [1]
+        set(pins, 1)            .side(1) [1]  # STOP : DIO RISES WHILE CLK IS HIGH
+        wrap()
+
+def encode_char(char):
+    o = ord(char)
+    if o == 32:
+        return SEGMENTS[36]
+    if o == 42:
+        return SEGMENTS[38]
+    if o == 45:
+        return SEGMENTS[37]
+    if 65 <= o <= 90:
+        return SEGMENTS[o-55]
+    if 97 <= o <= 122:
+        return SEGMENTS[o-87]
+    if 48 <= o <= 57:
+        return SEGMENTS[o-48]
+    raise ValueError("Character out of range: {:d} '{:s}'".format(o, chr(o)))
+
+def encode_string(string):
+    # RETURNS A VIEW OF THE SHARED BUFFER : COPY IT WHEN IT IS KEPT PAST THE NEXT CALL
+    n = len(string)
+    segments = _text_view[:n] if n <= TEXT_MAX else bytearray(n)
+    for i in range(n):
+        segments[i] = encode_char(string[i])
+    return segments
 
 class TM1637:
     def __init__(self, clk, dio, brightness=7):
@@ -21,11 +104,38 @@ class TM1637:
         self.dio.init(Pin.OUT, value=0)
         sleep_us(TM1637_DELAY)
 
-        self.top_buffer = [0] * 8     # top row (steps 1–8)
-        self.bottom_buffer = [0] * 8  # bottom row (steps 9–16)
+        # SHADOW OF THE DIGITS ON THE DISPLAY : ONLY BYTES THAT DIFFER ARE SENT
+        self.frame = bytearray(TM1637_DIGITS)
+        self.grid = bytearray(TM1637_DIGITS)
+        self.steps = 0  # STEP GRID, BIT n = STEP n + 1 LIT
+        self.writes = 0
+        self.skipped = 0
 
+        # BASE = WHAT THE CALLER SHOWED, OVERLAY = THE CURRENT ANIMATION FRAME ON TOP OF IT
+        self.base = bytearray(TM1637_DIGITS)
+        self.overlay = bytearray(TM1637_DIGITS)
+        self.jobs = []
+        self.active = False
+        self.generation = 0
+        self.dropped = 0
+        self.wake = asyncio.Event()
+        self._task = None
+
+        # PIO WHEN AVAILABLE, BIT-BANG OTHERWISE
+        self._sm = None
+        if rp2 is not None:
+            try:
+                self._sm = rp2.StateMachine(PIO_SM, _tm1637_tx, freq=PIO_FREQ,
+                                            out_base=dio, set_base=dio, sideset_base=clk)
+                self._sm.active(1)
+            except Exception as e:
+                self._sm = None
+                print("TM1637 PIO unavailable, bit-banging:", e)
+
+        # AUTO-INCREMENT MODE AND DISPLAY CONTROL PERSIST : SENT ONCE, NOT PER FRAME
         self._write_data_cmd()
         self._write_dsp_ctrl()
+        self._transfer(TM1637_CMD2, self.frame, 0, TM1637_DIGITS)
 
     def _start(self):
         self.dio(0)
@@ -40,15 +150,25 @@ class TM1637:
         sleep_us(TM1637_DELAY)
         self.dio(1)
 
-    def _write_data_cmd(self):
+    def _transfer(self, command, data=None, lo=0, hi=0):
+        # ONE START ... STOP FRAME : COMMAND BYTE, THEN data[lo:hi]
+        sm = self._sm
+        if sm is not None:
+            sm.put(PIO_START | (PIO_STOP if lo == hi else 0) | (command << 2))
+            for i in range(lo, hi):
+                sm.put((PIO_STOP if i == hi - 1 else 0) | (data[i] << 2))
+            return
         self._start()
-        self._write_byte(TM1637_CMD1)
+        self._write_byte(command)
+        for i in range(lo, hi):
+            self._write_byte(data[i])
         self._stop()
 
+    def _write_data_cmd(self):
+        self._transfer(TM1637_CMD1)
+
     def _write_dsp_ctrl(self):
-        self._start()
-        self._write_byte(TM1637_CMD3 | TM1637_DSP_ON | self._brightness)
-        self._stop()
+        self._transfer(TM1637_CMD3 | TM1637_DSP_ON | self._brightness)
 
     def _write_byte(self, b):
         for i in range(8):
@@ -71,85 +191,164 @@ class TM1637:
         if not 0 <= val <= 7:
             raise ValueError("Brightness out of range")
         self._brightness = val
-        self._write_data_cmd()
         self._write_dsp_ctrl()
 
-    def write(self, segments, pos=0):
+    def write(self, segments, pos=0, preempt=False):
+        # UPDATES THE BASE FRAME : HIDDEN UNDER A RUNNING ANIMATION UNLESS preempt CANCELS IT
+        base = self.base
+        for i in range(len(segments)):
+            addr = pos + i
+            if 0 <= addr < TM1637_DIGITS:
+                base[addr] = segments[i]
+        if preempt and self.active:
+            self.cancel()
+            return True
+        if self.active:
+            return False
+        return self._send(base)
+
+    def _send(self, segments):
+        # DIFF AGAINST THE SHADOW : SEND THE SPAN OF CHANGED DIGITS, OR NOTHING AT ALL
+        frame = self.frame
+        lo = TM1637_DIGITS
+        hi = 0
+        for i in range(TM1637_DIGITS):
+            if frame[i] != segments[i]:
+                frame[i] = segments[i]
+                if i < lo:
+                    lo = i
+                hi = i + 1
+        if hi == 0:
+            self.skipped += 1
+            return False
+        self._transfer(TM1637_CMD2 | lo, frame, lo, hi)
+        self.writes += 1
+        return True
+
+    def refresh(self):
+        # RESEND EVERYTHING (E.G. AFTER THE MODULE LOST POWER)
         self._write_data_cmd()
-        self._start()
-        self._write_byte(TM1637_CMD2 | pos)
-        for seg in segments:
-            self._write_byte(seg)
-        self._stop()
         self._write_dsp_ctrl()
+        self._transfer(TM1637_CMD2, self.frame, 0, TM1637_DIGITS)
 
     def encode_char(self, char):
-        _SEGMENTS = bytearray(b'\x3F\x06\x5B\x4F\x66\x6D\x7D\x07\x7F\x6F\x77\x7C\x39\x5E\x79\x71\x3D\x76\x06\x1E\x76\x38\x55\x54\x3F\x73\x67\x50\x6D\x78\x3E\x1C\x2A\x76\x6E\x5B\x00\x40\x63')
-        o = ord(char)
-        if o == 32:
-            return _SEGMENTS[36]
-        if o == 42:
-            return _SEGMENTS[38]
-        if o == 45:
-            return _SEGMENTS[37]
-        if 65 <= o <= 90:
-            return _SEGMENTS[o-55]
-        if 97 <= o <= 122:
-            return _SEGMENTS[o-87]
-        if 48 <= o <= 57:
-            return _SEGMENTS[o-48]
-        raise ValueError("Character out of range: {:d} '{:s}'".format(o, chr(o)))
+        return encode_char(char)
 
     def encode_string(self, string):
-        return bytearray([self.encode_char(c) for c in string])
+        return encode_string(string)
 
-    def show(self, string=None):
+    def show(self, string=None, preempt=False):
         if string is not None:
-            self.write(self.encode_string(string[:4]))
-        else:
-            display_buf = [0x00] * 4
-
-            # TOP row: steps 1–8 → segment F (bit 5, left) and B (bit 1, right)
-            for i in range(8):
-                col = i // 2
-                if self.top_buffer[i]:
-                    if i % 2 == 0:
-                        display_buf[col] |= 0b00100000  # segment F (left top)
-                    else:
-                        display_buf[col] |= 0b00000010  # segment B (right top)
-
-            # BOTTOM row: steps 9–16 → segment E (bit 4, left) and C (bit 2, right)
-            for i in range(8):
-                col = i // 2
-                if self.bottom_buffer[i]:
-                    if i % 2 == 0:
-                        display_buf[col] |= 0b00010000  # segment E (left bottom)
-                    else:
-                        display_buf[col] |= 0b00000100  # segment C (right bottom)
-
-            self.write(display_buf)
+            self.write(self.encode_string(string[:4]), 0, preempt)
+            return
+
+        # STEP GRID : TWO TABLE LOOKUPS PER DIGIT
+        steps = self.steps
+        grid = self.grid
+        grid[0] = TOP_PAIR[steps & 3] | BOTTOM_PAIR[(steps >> 8) & 3]
+        grid[1] = TOP_PAIR[(steps >> 2) & 3] | BOTTOM_PAIR[(steps >> 10) & 3]
+        grid[2] = TOP_PAIR[(steps >> 4) & 3] | BOTTOM_PAIR[(steps >> 12) & 3]
+        grid[3] = TOP_PAIR[(steps >> 6) & 3] | BOTTOM_PAIR[(steps >> 14) & 3]
+        self.write(grid, 0, preempt)
 
     def clear(self):
-        self.top_buffer = [0] * 8
-        self.bottom_buffer = [0] * 8
-        self.show()
+        # CLEARS THE STEP GRID ONLY : NOTHING IS SENT UNTIL THE NEXT show()
+        self.steps = 0
+
+    # ANIMATION : scroll / blink / flash QUEUE A JOB AND RETURN AT ONCE
+
+    # (JOBS OUTLIVE THE CALL : THEY KEEP A COPY OF THE SHARED ENCODE BUFFER)
 
     def scroll(self, string, delay=250):
-        segments = self.encode_string(string)
-        padded = [0x00] * 4 + list(segments) + [0x00] * 4
-        for i in range(len(padded) - 3):
-            self.write(padded[i:i+4])
-            sleep_ms(delay)
+        self._queue(JOB_SCROLL, bytes(self.encode_string(string)), delay, 0, 1)
+
+    def blink(self, string, times=3, on_ms=250, off_ms=250):
+        self._queue(JOB_BLINK, bytes(self.encode_string(string[:4])), on_ms, off_ms, times)
+
+    def flash(self, string, duration=500):
+        self._queue(JOB_FLASH, bytes(self.encode_string(string[:4])), duration, 0, 1)
+
+    def cancel(self):
+        # DROP THE RUNNING AND QUEUED ANIMATIONS, PUT THE BASE FRAME BACK
+        self.generation += 1
+        self.jobs.clear()
+        if self.active:
+            self.active = False
+            self._send(self.base)
 
-    def number(self, num):
+    def animating(self):
+        return self.active or bool(self.jobs)
+
+    def _queue(self, kind, segments, on_ms, off_ms, count):
+        # FULL QUEUE : THE OLDEST WAITING JOB GIVES WAY
+        if len(self.jobs) >= JOB_SLOTS:
+            self.jobs.pop(0)
+            self.dropped += 1
+        self.jobs.append((kind, segments, on_ms, off_ms, count))
+        self.active = True  # CALLER WRITES FROM HERE ON LAND IN THE BASE FRAME
+        if self._task is None:
+            self._task = asyncio.create_task(self._animate())
+        self.wake.set()
+
+    def _window(self, segments, offset):
+        overlay = self.overlay
+        n = len(segments)
+        for i in range(TM1637_DIGITS):
+            j = offset + i
+            overlay[i] = segments[j] if 0 <= j < n else 0
+
+    async def _frame(self, generation, delay):
+        # A CANCEL (OR A PREEMPTING write) BETWEEN FRAMES ENDS THE JOB WITHOUT TOUCHING THE BUS
+        if generation != self.generation:
+            return False
+        self._send(self.overlay)
+        await asyncio.sleep_ms(delay)
+        return generation == self.generation
+
+    async def _animate(self):
+        while True:
+            if not self.jobs:
+                self.wake.clear()
+                await self.wake.wait()
+                continue
+
+            kind, segments, on_ms, off_ms, count = self.jobs.pop(0)
+            generation = self.generation
+            self.active = True
+            if kind == JOB_SCROLL:
+                # IN FROM THE RIGHT, OUT TO THE LEFT
+                for offset in range(-TM1637_DIGITS, len(segments) + 1):
+                    self._window(segments, offset)
+                    if not await self._frame(generation, on_ms):
+                        break
+            elif kind == JOB_BLINK:
+                for _ in range(count):
+                    self._window(segments, 0)
+                    if not await self._frame(generation, on_ms):
+                        break
+                    self._window(segments, TM1637_DIGITS)
+                    if not await self._frame(generation, off_ms):
+                        break
+            else:
+                self._window(segments, 0)
+                await self._frame(generation, on_ms)
+
+            if generation == self.generation and not self.jobs:
+                self.active = False
+                self._send(self.base)
+
+    def number(self, num, preempt=False):
         num = max(-999, min(num, 9999))
         string = '{0: >4d}'.format(num)
-        self.show(string)
+        self.show(string, preempt)
+
+    def set_steps(self, mask):
+        self.steps = mask & 0xFFFF
 
     def set_top(self, col, state):
         if 0 <= col < 8:
-            self.top_buffer[col] = 1 if state else 0
+            self.steps = self.steps | (1 << col) if state else self.steps & ~(1 << col)
 
     def set_bottom(self, col, state):
         if 0 <= col < 8:
-            self.bottom_buffer[col] = 1 if state else 0
+            self.steps = self.steps | (256 << col) if state else self.steps & ~(256 << col)
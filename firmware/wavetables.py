@@ -0,0 +1,109 @@
+from micropython import const
+from array import array
+import math
+
+# SHARED WAVETABLE BANK : BUILT ONCE AT IMPORT (OR LOADED FROM FLASH), USED BY EVERY SYNTH
+TABLE_BITS = const(8)
+TABLE_SIZE = const(256)
+TABLE_MASK = const(255)
+
+# BAND-LIMITING : ONE TABLE PER OCTAVE, HARMONICS KEPT BELOW NYQUIST AT THE TOP OF THE OCTAVE
+SAMPLE_RATE = const(20000)
+BASE_FREQ = 32.0  # OCTAVE 0 = 32-64 HZ (LOWEST NOTE AT OCTAVE -3 IS ~32.7 HZ)
+OCTAVES = const(8)
+
+BANK_FILE = "wavetables.bin"
+BANK_MAGIC = b"PWT1"
+
+WAVEFORMS = ("SIN", "TRI", "SAW", "SQR")
+ALIASES = {"TRIANGLE": "TRI", "SAWTOOTH": "SAW", "SQUARE": "SQR"}
+
+def _harmonics(octave):
+    top = BASE_FREQ * (2 << octave)
+    return max(1, min(TABLE_SIZE // 2 - 1, int(SAMPLE_RATE / 2 / top)))
+
+def _partial(waveform, k):
+    # FOURIER AMPLITUDE OF HARMONIC k
+    if waveform == "SAW":
+        return 1 / k if k & 1 else -1 / k
+    if not k & 1:
+        return 0
+    if waveform == "SQR":
+        return 1 / k
+    return 1 / (k * k) if not k & 2 else -1 / (k * k)
+
+def _quantize(values):
+    lo = min(values)
+    span = max(values) - lo
+    table = array('H', [0] * TABLE_SIZE)
+    for i in range(TABLE_SIZE):
+        table[i] = int((values[i] - lo) * 65535 / span)
+    return table
+
+def _build():
+    sine = [math.sin(2 * math.pi * i / TABLE_SIZE) for i in range(TABLE_SIZE)]
+    bank = {"SIN": [_quantize(sine)]}
+
+    for waveform in WAVEFORMS[1:]:
+        # WALK DOWN FROM THE TOP OCTAVE, ADDING HARMONICS TO ONE RUNNING SUM
+        acc = [0.0] * TABLE_SIZE
+        tables = [None] * OCTAVES
+        k = 0
+        for octave in range(OCTAVES - 1, -1, -1):
+            top = _harmonics(octave)
+            while k < top:
+                k += 1
+                amp = _partial(waveform, k)
+                if amp:
+                    for i in range(TABLE_SIZE):
+                        acc[i] += amp * sine[(k * i) & TABLE_MASK]
+            tables[octave] = _quantize(acc)
+        bank[waveform] = tables
+    return bank
+
+def _load(path):
+    bank = {}
+    with open(path, "rb") as f:
+        if f.read(4) != BANK_MAGIC:
+            raise ValueError("Wavetable bank header mismatch")
+        for waveform in WAVEFORMS:
+            tables = []
+            for _ in range(1 if waveform == "SIN" else OCTAVES):
+                table = array('H', [0] * TABLE_SIZE)
+                if f.readinto(table) != TABLE_SIZE * 2:
+                    raise ValueError("Wavetable bank truncated")
+                tables.append(table)
+            bank[waveform] = tables
+    return bank
+
+def save(path=BANK_FILE):
+    with open(path, "wb") as f:
+        f.write(BANK_MAGIC)
+        for waveform in WAVEFORMS:
+            for table in BANK[waveform]:
+                f.write(table)
+
+def resolve(waveform):
+    waveform = ALIASES.get(waveform, waveform)
+    return waveform if waveform in WAVEFORMS else "SIN"
+
+def get_table(waveform, freq=0):
+    tables = BANK[resolve(waveform)]
+    octave = 0
+    top = BASE_FREQ * 2
+    while freq >= top and octave < len(tables) - 1:
+        octave += 1
+        top *= 2
+    return tables[octave]
+
+# LOAD THE PRECOMPUTED BANK FROM FLASH, BUILD (AND CACHE) IT ON FIRST BOOT
+try:
+    BANK = _load(BANK_FILE)
+except (OSError, ValueError):
+    BANK = _build()
+    try:
+        save(BANK_FILE)
+    except OSError:
+        pass
+
+SINE = BANK["SIN"][0]
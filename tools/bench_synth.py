@@ -0,0 +1,148 @@
+# HOST-SIDE SYNTH BENCHMARK : SAMPLES PER SECOND FOR EACH CONTROL MODE
+# COMPARES THE ORIGINAL FLOAT LOOP (BEFORE) AGAINST THE FIXED-POINT ENGINE (AFTER)
+# USAGE : python tools/bench_synth.py [samples]
+import math
+import sys
+import time
+
+import hostenv
+
+hostenv.install()
+
+import micropython
+from synthesizer import Synthesizer, VOICES
+
+# CONTROL MODE : DEFAULT VALUE SET BY THE CONFIGURE MENU
+MODES = [
+    ("DISABLED", 0),
+    ("CUTOFF", 32767),
+    ("ASDR", 10000),
+    ("ASDR_WAVE", 32767),
+    ("FILTER SWEEP", 1000),
+    ("FILTER MOD", 16384),
+    ("PITCH BEND", 32767),
+]
+
+
+def _noop(_):
+    pass
+
+
+def legacy_play_note(self):
+    # ORIGINAL PER-SAMPLE FLOAT LOOP, KEPT VERBATIM AS THE BASELINE
+    self.thread_lock = True
+    start_time = time.ticks_ms()
+    envelope_phase = 0
+    filter_phase = 0
+    bend_phase = 0
+    bend_max = 200
+    sweep_max = 200
+    attack = max(1, int(self.control_value / 4))
+
+    while self.running:
+        micropython.schedule(_noop, 0)
+        self.phase_inc = self.freq * self.table_size / self.sample_rate
+        self.phase_acc = (self.phase_acc + self.phase_inc) % self.table_size
+        index = int(self.phase_acc) % self.table_size
+        sample = self.current_table[index]
+
+        if self.control == "CUTOFF":
+            cutoff_index = int((self.freq / self.sample_rate) * self.control_value * self.table_size)
+            smooth_factor = 0.8
+            if index > cutoff_index:
+                sample = int(sample * smooth_factor)
+
+        if self.control == "ASDR":
+            amp = min(1.0, envelope_phase / attack)
+            sample = int(sample * amp)
+
+        elif self.control == "ASDR_WAVE":
+            cycle = (envelope_phase / self.sample_rate)
+            envelope = min(1.0, (1 - abs(math.sin(cycle * math.pi))) * (self.control_value / 65535))
+            sample = int(sample * envelope)
+
+        elif self.control == "FILTER SWEEP":
+            sweep_max = max(1, int(self.sample_rate / self.freq))
+            sweep_ratio = (math.sin(2 * math.pi * (filter_phase / sweep_max)) + 1) / 2
+            mod = int(self.control_value * sweep_ratio)
+            sample = int(sample * (mod / 100.0))
+            filter_phase = (filter_phase + 1) % sweep_max
+
+        if self.control == "FILTER MOD":
+            mod = math.sin(time.ticks_ms() / 50.0)
+            depth = self.control_value / 32767.0
+            freq_mod = self.freq * (1.0 + depth * mod * 0.1)
+            self.phase_inc = int((freq_mod * self.table_size) / self.sample_rate * (1 << 16))
+
+        if self.control == "PITCH BEND":
+            semitone_range = 2
+            bend = (self.control_value / 32767.0 - 0.5) * 2 * semitone_range
+            bend_factor = 2 ** (bend / 12.0)
+            self.phase_inc = int((self.freq * bend_factor * self.table_size) / self.sample_rate * (1 << 16))
+
+        sample = int(sample * self.volume)
+        sample = max(0, min(65535, sample))
+        self.pwm.duty_u16(sample)
+        time.sleep_us(int(1_000_000 / self.sample_rate))
+
+    self.running = False
+    self.thread_lock = False
+    self.pwm.duty_u16(0)
+
+
+def make_synth(control, value):
+    program_data = {"waveform": "SIN", "control": control, "control_value": value}
+    return Synthesizer(program_data=program_data)
+
+
+def measure_legacy(synth, samples):
+    def on_write(pwm):
+        if pwm.writes >= samples:
+            synth.running = False
+
+    synth.pwm = synth.output.pwm
+    synth.freq = 440
+    synth.phase_acc = 0
+    synth.current_table = synth.sine_table
+    synth.pwm.writes = 0
+    synth.pwm.on_write = on_write
+    synth.running = True
+    start = time.perf_counter()
+    legacy_play_note(synth)
+    elapsed = time.perf_counter() - start
+    synth.pwm.on_write = None
+    return samples / elapsed
+
+
+def measure_render(synth, samples, voices=1):
+    # RENDER STRAIGHT INTO A BLOCK, AS THE AUDIO THREAD FEEDS THE OUTPUT RING BUFFER
+    synth.worker_running = True  # KEEP note_on FROM STARTING THE AUDIO WORKER
+    for i in range(voices):
+        synth.note_on(69 + 4 * i, key=i + 1)
+    synth.process_commands()
+    block = synth.block
+    n = len(block)
+    start = time.perf_counter()
+    for _ in range(samples // n):
+        synth.render_block(block, n)
+    elapsed = time.perf_counter() - start
+    return (samples // n) * n / elapsed
+
+
+def main():
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    print("{:<14}{:>14}{:>14}{:>9}".format("MODE", "BEFORE/s", "AFTER/s", "GAIN"))
+    for control, value in MODES:
+        before = measure_legacy(make_synth(control, value), samples)
+        after = measure_render(make_synth(control, value), samples)
+        print("{:<14}{:>14.0f}{:>14.0f}{:>8.1f}x".format(control, before, after, after / before))
+
+    print()
+    print("{:<14}{:>14}".format("ALL VOICES", "AFTER/s"))
+    for control, value in MODES:
+        after = measure_render(make_synth(control, value), samples, voices=VOICES)
+        print("{:<14}{:>14.0f}".format(control, after))
+
+
+if __name__ == "__main__":
+    main()
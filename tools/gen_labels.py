@@ -0,0 +1,94 @@
+# BUILDS THE MENU LABEL ATLAS OFFLINE : EVERY LABEL PRE-ENCODED TO 4 SEGMENT BYTES
+# RE-RUN AFTER CHANGING THE TABLE BELOW, THEN COPY (OR FREEZE) firmware/labels.py
+# USAGE : python tools/gen_labels.py [output]
+import os
+import sys
+
+import hostenv
+
+hostenv.install()
+
+import tm1637
+
+# DISPLAY MODE -> TEXT (LEFT ALIGNED, PADDED TO 4 DIGITS)
+LABELS = (
+    # PROGRAMS
+    ("P1", "P1"),
+    ("P2", "P2"),
+    ("P3", "P3"),
+    ("P4", "P4"),
+
+    # PROGRAM SUB-MENU
+    ("SELECT", "SEL"),
+    ("SAMPLE", "SAMP"),
+    ("SYNTH", "SYNT"),
+    ("SEQ", "SEQ"),
+    ("CONFIGURE", "CNFG"),
+
+    # CONFIGURATION MENU
+    ("BACK", "BACK"),
+    ("BPM", "BPM"),
+
+    # WAVEFORMS
+    ("WAVE", "WAVE"),
+    ("SIN", "SIN"),
+    ("TRI", "TRI"),
+    ("SAW", "SAW"),
+    ("SQR", "SQR"),
+
+    # CONTROL MODES
+    ("CTRL", "CTRL"),
+    ("DISABLED", "DSBL"),
+    ("CUTOFF", "CUT"),
+    ("ASDR", "FIN"),
+    ("ASDR_WAVE", "ASDR"),
+    ("FILTER MOD", "FMOD"),
+    ("FILTER SWEEP", "FSWP"),
+    ("PITCH BEND", "PBND"),
+    ("ON", "ON"),
+    ("OFF", "OFF"),
+
+    # MIDI / SYNC
+    ("MIDI", "MIDI"),
+    ("MIDI ON", "ON"),
+    ("MIDI OFF", "OFF"),
+    ("SYNC", "SYNC"),
+    ("SYNC ON", "ON"),
+    ("SYNC OFF", "OFF"),
+    ("PULSE", "PPS"),
+
+    # CLOCK SOURCE
+    ("CLOCK", "CLK"),
+    ("CLOCK INT", "INT"),
+    ("CLOCK MIDI", "MIDI"),
+    ("CLOCK SYNC", "SYNC"),
+)
+
+DEFAULT_PATH = os.path.join(os.path.dirname(__file__), "..", "firmware", "labels.py")
+
+
+def literal(segments):
+    return "b'" + "".join("\\x{:02X}".format(b) for b in segments) + "'"
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PATH
+    lines = [
+        "# GENERATED BY tools/gen_labels.py : DO NOT EDIT",
+        "# MENU LABELS PRE-ENCODED TO TM1637 SEGMENTS, WRITTEN TO THE DISPLAY AS-IS",
+        "",
+        "BLANK = " + literal(bytes(tm1637.TM1637_DIGITS)),
+        "",
+        "LABELS = {",
+    ]
+    for mode, text in LABELS:
+        segments = bytes(tm1637.encode_string("{:<4s}".format(text)[:tm1637.TM1637_DIGITS]))
+        lines.append("    {!r}: {},  # {}".format(mode, literal(segments), text))
+    lines.append("}")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    print("Wrote", path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+# BUILDS THE BAND-LIMITED WAVETABLE BANK OFFLINE
+# COPY THE RESULT TO THE BOARD NEXT TO wavetables.py TO SKIP THE FIRST-BOOT BUILD
+# USAGE : python tools/gen_wavetables.py [output]
+import sys
+
+import hostenv
+
+hostenv.install()
+
+import wavetables
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else wavetables.BANK_FILE
+    wavetables.BANK = wavetables._build()
+    wavetables.save(path)
+    print("Wrote", path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# HOST-SIDE STAND-INS FOR THE MICROPYTHON RUNTIME
+# LETS THE FIRMWARE MODULES IMPORT UNDER CPYTHON FOR BENCHMARKS AND REPLAY TOOLS
+import asyncio
+import json
+import os
+import sys
+import time
+import types
+
+FIRMWARE_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "firmware"))
+
+_T0 = time.perf_counter_ns()
+
+
+def ticks_us():
+    return ((time.perf_counter_ns() - _T0) // 1000) & 0x3FFFFFFF
+
+
+def ticks_ms():
+    return ((time.perf_counter_ns() - _T0) // 1_000_000) & 0x3FFFFFFF
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & 0x3FFFFFFF
+
+
+def ticks_diff(a, b):
+    diff = (a - b) & 0x3FFFFFFF
+    return diff - 0x40000000 if diff & 0x20000000 else diff
+
+
+def sleep_us(us):
+    pass
+
+
+def sleep_ms(ms):
+    pass
+
+
+# MACHINE
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 1
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, pin_id, mode=-1, pull=-1, value=None):
+        self.id = pin_id
+        self._value = 1 if value is None else value
+
+    def init(self, mode=-1, pull=-1, value=None):
+        if value is not None:
+            self._value = value
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        self._value = v
+
+    def __call__(self, v=None):
+        return self.value(v)
+
+    def irq(self, handler=None, trigger=0, hard=False):
+        self.handler = handler
+
+
+class PWM:
+    def __init__(self, pin):
+        self.pin = pin
+        self.writes = 0
+        self.duty = 0
+        self.on_write = None
+
+    def freq(self, f=None):
+        return 20000 if f is None else None
+
+    def duty_u16(self, value=None):
+        if value is None:
+            return self.duty
+        self.duty = value
+        self.writes += 1
+        if self.on_write:
+            self.on_write(self)
+
+
+class Timer:
+    PERIODIC = 1
+    ONE_SHOT = 0
+
+    def __init__(self, timer_id=-1, **kwargs):
+        self.callback = None
+
+    def init(self, mode=PERIODIC, freq=-1, period=-1, callback=None, **kwargs):
+        self.callback = callback
+
+    def deinit(self):
+        self.callback = None
+
+
+class UART:
+    # FAKE UART : RECORDS WRITES, REPLAYS RECORDED RX BYTES AND SCRIPTED REPLIES
+    def __init__(self, uart_id=0, baudrate=9600, tx=None, rx=None, **kwargs):
+        self.written = bytearray()
+        self.rx = bytearray()
+        self.replies = {}
+        self.handler = None
+
+    def init(self, baudrate=9600, **kwargs):
+        pass
+
+    def feed(self, data):
+        self.rx.extend(data)
+        if self.handler:
+            self.handler(self)
+
+    def reply_to(self, command, frame):
+        # DFPLAYER-STYLE : WHEN A FRAME WITH THIS COMMAND BYTE IS WRITTEN, QUEUE frame AS THE ANSWER
+        self.replies[command] = bytes(frame)
+
+    def write(self, buf):
+        self.written.extend(buf)
+        if len(buf) > 3 and buf[3] in self.replies:
+            self.feed(self.replies[buf[3]])
+        return len(buf)
+
+    def any(self):
+        return len(self.rx)
+
+    def readinto(self, buf, nbytes=None):
+        n = min(len(buf), len(self.rx), len(buf) if nbytes is None else nbytes)
+        if not n:
+            return None
+        buf[:n] = self.rx[:n]
+        del self.rx[:n]
+        return n
+
+    def read(self, nbytes=None):
+        n = len(self.rx) if nbytes is None else min(nbytes, len(self.rx))
+        if not n:
+            return None
+        data = bytes(self.rx[:n])
+        del self.rx[:n]
+        return data
+
+    def irq(self, handler=None, trigger=0, hard=False):
+        self.handler = handler
+
+    IRQ_RXIDLE = 1
+
+
+def _const(value):
+    return value
+
+
+def _passthrough(func):
+    return func
+
+
+def install():
+    if "machine" in sys.modules:
+        return
+
+    for name in ("ticks_us", "ticks_ms", "ticks_add", "ticks_diff", "sleep_us", "sleep_ms"):
+        setattr(time, name, globals()[name])
+    sys.modules["utime"] = time
+
+    machine = types.ModuleType("machine")
+    machine.Pin = Pin
+    machine.PWM = PWM
+    machine.Timer = Timer
+    machine.UART = UART
+    machine.disable_irq = lambda: 0
+    machine.enable_irq = lambda state: None
+    sys.modules["machine"] = machine
+
+    micropython = types.ModuleType("micropython")
+    micropython.const = _const
+    micropython.native = _passthrough
+    micropython.viper = _passthrough
+    micropython.schedule = lambda func, arg: None
+    micropython.alloc_emergency_exception_buf = lambda size: None
+    sys.modules["micropython"] = micropython
+
+    async def _sleep_ms(ms):
+        await asyncio.sleep(ms / 1000)
+
+    async def _wait_for_ms(aw, ms):
+        return await asyncio.wait_for(aw, ms / 1000)
+
+    asyncio.sleep_ms = _sleep_ms
+    asyncio.wait_for_ms = _wait_for_ms
+    sys.modules["uasyncio"] = asyncio
+    sys.modules["ujson"] = json
+
+    if FIRMWARE_DIR not in sys.path:
+        sys.path.insert(0, FIRMWARE_DIR)
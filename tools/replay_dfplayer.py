@@ -0,0 +1,120 @@
+# REPLAYS RECORDED DFPLAYER RX FRAMES THROUGH THE DRIVER'S PARSER ON THE HOST
+# EACH LINE OF A CAPTURE FILE IS ONE HEX FRAME (SPACES OPTIONAL, # COMMENTS IGNORED)
+# USAGE : python tools/replay_dfplayer.py             CHECKS THE PARSER AGAINST THE BUILT-IN CAPTURE
+#         python tools/replay_dfplayer.py capture.txt PRINTS THE CACHED STATE AFTER EACH RECORDED FRAME
+import asyncio
+import sys
+
+import hostenv
+
+hostenv.install()
+
+from dfplayer import DFPlayer, CMD_QUERY_STATUS
+
+# RECORDED FROM THE MODULE : BOOT, PLAY, TRACK FINISHED, BAD FILE, CARD PULLED / REINSERTED
+# EACH FRAME WITH THE STATE IT MUST LEAVE BEHIND
+CAPTURE = [
+    ("7e ff 06 3f 00 00 02 fe ba ef", {"card_present": True}),  # INIT : SD ONLINE
+    ("7e ff 06 41 00 00 00 fe ba ef", {}),  # ACK
+    ("7e ff 06 42 00 02 01 fe b6 ef", {"playing": True}),  # STATUS : PLAYING
+    ("7e ff 06 3d 00 00 05 fe b9 ef", {"playing": False, "finished_track": 5}),  # TRACK 5 FINISHED
+    ("7e ff 06 40 00 00 06 fe b5 ef", {"error": 6}),  # ERROR 6 : FILE NOT FOUND
+    ("7e ff 06 43 00 00 1e fe 9a ef", {"volume_level": 30}),  # VOLUME 30
+    ("7e ff 06 3b 00 00 02 fe be ef", {"card_present": False}),  # CARD REMOVED
+    ("7e ff 06 3a 00 00 02 fe bf ef", {"card_present": True}),  # CARD INSERTED
+    ("7e ff 06 42 00 02 01 fe b7 ef", {"playing": False}),  # CORRUPTED CHECKSUM : MUST BE REJECTED
+    ("00 7e ff 06 4c 00 00 0c fe a3 ef", {"track": 12}),  # LINE NOISE, THEN CURRENT TRACK 12
+]
+CAPTURE_FRAMES = 9
+CAPTURE_ERRORS = 1
+
+
+def frame(command, value):
+    checksum = -(0xFF + 0x06 + command + (value >> 8) + (value & 0xFF)) & 0xFFFF
+    return bytes([0x7E, 0xFF, 0x06, command, 0x00, value >> 8, value & 0xFF, checksum >> 8, checksum & 0xFF, 0xEF])
+
+
+def load(path):
+    frames = []
+    with open(path) as f:
+        for line in f:
+            line = line.split("#")[0].strip()
+            if line:
+                frames.append(line)
+    return frames
+
+
+def state(df):
+    return "playing={} track={} finished={} error={} card={} volume={} frames={} errors={}".format(
+        df.playing, df.track, df.finished_track, df.error, df.card_present, df.volume_level, df.rx_frames, df.rx_errors)
+
+
+def expect(df, label, frames=None, errors=None, **fields):
+    if frames is not None:
+        assert df.rx_frames == frames, "{} : {} frames, expected {}".format(label, df.rx_frames, frames)
+    if errors is not None:
+        assert df.rx_errors == errors, "{} : {} errors, expected {}".format(label, df.rx_errors, errors)
+    for name, value in fields.items():
+        assert getattr(df, name) == value, "{} : {}={}, expected {}".format(label, name, getattr(df, name), value)
+    print("ok   ", label.ljust(40), state(df))
+
+
+async def replay(df, data):
+    df.uart.feed(data)
+    await asyncio.sleep_ms(10)
+
+
+async def check():
+    # GOOD FRAMES, ONE PER READ
+    df = DFPlayer()
+    for line, fields in CAPTURE:
+        await replay(df, bytes.fromhex(line))
+        expect(df, line, **fields)
+    expect(df, "capture totals", CAPTURE_FRAMES, CAPTURE_ERRORS)
+
+    # TRUNCATED REPLY : THE GOOD FRAME BEHIND IT IS STILL PARSED
+    df = DFPlayer()
+    await replay(df, bytes.fromhex("7e ff 06 42 00") + frame(0x3D, 7))
+    expect(df, "truncated, then track 7 finished", 1, 1, finished_track=7)
+
+    # CORRUPTED HEADER (LENGTH BYTE) : REJECTED AT ONCE, THE NEXT FRAME PARSES
+    df = DFPlayer()
+    await replay(df, bytes.fromhex("7e ff 07 40 00") + frame(0x40, 3))
+    expect(df, "bad length byte, then error 3", 1, 1, error=3)
+
+    # CORRUPTED CHECKSUM WITH A START BYTE INSIDE THE PAYLOAD
+    df = DFPlayer()
+    await replay(df, bytes.fromhex("7e ff 06 4c 00 7e 0c fe a3 ef") + frame(0x4C, 3))
+    expect(df, "bad checksum, then track 3", 1, 1, track=3)
+
+    # BACK-TO-BACK FRAMES IN ONE READ, THEN ONE FRAME SPLIT ACROSS TWO READS
+    df = DFPlayer()
+    await replay(df, frame(0x3F, 2) + frame(0x4C, 14) + frame(0x40, 6))
+    expect(df, "three frames in one read", 3, 0, card_present=True, track=14, error=6)
+    data = frame(0x3D, 9)
+    await replay(df, data[:4])
+    await replay(df, data[4:])
+    expect(df, "one frame split across two reads", 4, 0, finished_track=9)
+
+    # SCRIPTED ROUND TRIP, THEN A QUERY THE FAKE NEVER ANSWERS
+    df = DFPlayer()
+    df.uart.reply_to(CMD_QUERY_STATUS, frame(CMD_QUERY_STATUS, 0x0200))
+    status = await df.query_status()
+    assert status == 0, "query_status -> {}".format(status)
+    print("ok    query_status ->", status)
+    track = await df.query_track(timeout_ms=50)
+    assert track is None, "query_track -> {}, expected a timeout".format(track)
+    assert df.pending_cmd == 0
+    print("ok    query_track  -> None (timeout)")
+    print("all checks passed")
+
+
+async def main():
+    df = DFPlayer()
+    for line in load(sys.argv[1]):
+        await replay(df, bytes.fromhex(line))
+        print(line.ljust(34), state(df))
+
+
+if __name__ == "__main__":
+    asyncio.run(main() if len(sys.argv) > 1 else check())